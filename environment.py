@@ -1,27 +1,38 @@
 from __future__ import annotations
-import copy
 import logging
+import multiprocessing
 import os
 import pathlib
+import random
 import sys
 import time
+from collections import deque
 from dataclasses import dataclass
 from typing import Callable
 
+import numpy as np
 import pandas
 import pygame
 
-from game import gameEngine
+from game import batchEngine, gameEngine
+from game.batchEngine import GameBatch
 from game.gameInstance import GameInstance
 from game.gui import Gui
 from player.playerProtocol import PlayerI
 from player.treeAgent import TreeAgent
-from training.decisionTree3 import FeatureSet, DecisionTree
+from training import columnar
+from training.decisionTree3 import CompiledTree, FeatureSet, DecisionTree, RowExtractor
 from training.geneticAlgorithm import GA, Pack
-from training.logger import Logger
+from training.logger import Logger, recordLine
 
 _DATASET_NAME = "dataset.csv"
+_COLUMNAR_DATASET_NAME = "dataset.cols"  # copia binaria a colonne del dataset.csv (vedi training.columnar)
 _ENV_FILE = "env"
+_TRAIN_STEPS = 2000  # passi di gioco per ogni task della modalita' parallela di Console.train
+_QUERY_CHUNK = 256  # numero di partite passate per volta a un player senza `queryBatch` in Console.playBatch
+
+# Ambiente installato in ogni processo usato da Console.train e Console.performance in modalita' parallela (vedi Console._initWorker)
+_workerEnv: dict[str, Environment] = dict()
 
 
 @dataclass(init=False)
@@ -31,7 +42,7 @@ class Environment:
 
     Methods
     -------
-    setFeatures(self, features: FeatureSet, extractor: Callable[[GameInstance], dict[str, any]]) -> None
+    setFeatures(self, features: FeatureSet, extractor: Callable[[GameInstance], dict[str, any]], batchExtractor: Callable[[GameBatch, numpy.ndarray], dict[str, numpy.ndarray]] = None, rowFiller: Callable[[GameInstance, numpy.ndarray], None] = None) -> None
         Configura i dati delle features
     getFeatures(self) -> FeatureSet
         Restituisce l'insieme di features
@@ -49,6 +60,8 @@ class Environment:
     trainer: PlayerI                                       # Agente utilizzato per creare il dataset
     features: FeatureSet                                   # L'insieme delle features
     extractor: Callable[[GameInstance], dict[str, any]]    # Funzione che dato uno stato del mondo restituisce dizionario {feature: value}. Sostanzialmente corrisponde ai "sensori" dell'agente
+    batchExtractor: Callable[[GameBatch, np.ndarray], dict[str, np.ndarray]]  # (opzionale) come extractor, ma per piu' partite di un GameBatch: restituisce {feature: valori}
+    rowExtractor: RowExtractor                             # (opzionale) come extractor, ma scrive i valori per posizione in una riga preallocata (vedi FeatureSet.compile)
     gameEnv: GameInstance                                  # stato del mondo
     prepackAlgorithm: Callable[[pandas.DataFrame], Pack]   # Funzione che, dato un dataset, restituisce la configurazione dell'algoritmo genetico
     maxDataSize: int                                       # grandezza massima del dataset (numero di righe)
@@ -58,11 +71,15 @@ class Environment:
         self.trainer = None
         self.features = None
         self.extractor = None
+        self.batchExtractor = None
+        self.rowExtractor = None
         self.gameEnv = None
         self.prepackAlgorithm = None
 
     # Features
-    def setFeatures(self, features: FeatureSet, extractor: Callable[[GameInstance], dict[str, any]]) -> None:
+    def setFeatures(self, features: FeatureSet, extractor: Callable[[GameInstance], dict[str, any]],
+                    batchExtractor: Callable[[GameBatch, np.ndarray], dict[str, np.ndarray]] = None,
+                    rowFiller: Callable[[GameInstance, np.ndarray], None] = None) -> None:
         """
         Configura i dati delle features
 
@@ -72,12 +89,21 @@ class Environment:
             l'insieme di features
         extractor: Callable[[GameInstance], dict[str, any]]
             la funzione per estrarre i dati da uno stato del mondo
+        batchExtractor: Callable[[GameBatch, numpy.ndarray], dict[str, numpy.ndarray]] = None
+            (opzionale) la funzione per estrarre i dati dalle partite di un GameBatch (indicate dal secondo parametro)
+            direttamente dagli array del batch. Deve restituire gli stessi valori di `extractor`, un array per feature
+        rowFiller: Callable[[GameInstance, numpy.ndarray], None] = None
+            (opzionale) la funzione che scrive i dati di uno stato del mondo in una riga, nell'ordine di `features.columns()`.
+            Viene compilata con `features.compile` e usata dagli agenti al posto di `extractor`, che puo' essere None
+            (in tal caso viene ricavato dalla riga)
         """
         if self.features is not None and self.features != features:
             logging.error("It's not a good idea to change the features. Aborting...")
             return
         self.features = features
-        self.extractor = extractor
+        self.rowExtractor = features.compile(rowFiller) if rowFiller is not None else None
+        self.extractor = extractor if extractor is not None or self.rowExtractor is None else self.rowExtractor.extract
+        self.batchExtractor = batchExtractor
 
     def getFeatures(self) -> FeatureSet:
         """
@@ -101,7 +127,7 @@ class Environment:
         if self.gameEnv is None:
             logging.error("The game environment has not been set. Returning the default one...")
             return GameInstance()
-        return copy.deepcopy(self.gameEnv)
+        return self.gameEnv.clone()
 
     def setTrainer(self, trainer: PlayerI, maxDataSize: int = None) -> None:
         """
@@ -137,12 +163,16 @@ class Console:
     -------
     runAlgorithm(self)
         Esegue l'algoritmo genetico
-    train(self, maxTimeSeconds: int = 10, overwrite: bool = False)
+    train(self, maxTimeSeconds: int = 10, overwrite: bool = False, gui: bool = False, processes: int = None)
         Esegue delle partite per creare il dataset
     play(self, player: PlayerI, gui: bool = True, log: bool = False)
         Esegue una partita con un dato giocatore
+    playBatch(self, player: PlayerI, games: int = 100, seed: int = None) -> numpy.ndarray
+        Esegue piu' partite insieme con un dato giocatore
     replay(self, first: int = 0, last: int = None)
         Effettua delle partite con il miglior individuo di ogni generazione prodotta dal GA
+    performance(self, games: int = 100, processes: int = None, gamesPerJob: int = None, seed: int = None) -> pandas.DataFrame
+        Stampa e restituisce la distribuzione dei punteggi del miglior individuo di ogni generazione
     printDecisionTree(cls, treeFile: str, outFile: str)
         Disegna un DecisionTree
     drawHistoryGraph(self, outFile: str = None)
@@ -172,7 +202,7 @@ class Console:
         self.dataset = None
         datasetPath = os.path.join(self.rootDir, _DATASET_NAME)
         if os.path.isfile(datasetPath):
-            self.dataset = pandas.read_csv(datasetPath, index_col=0)
+            self.dataset = self._loadDataset()
             self.gaInstance = GA(self.env.prepackAlgorithm(self.dataset), self.rootDir)
 
     def runAlgorithm(self):
@@ -187,7 +217,7 @@ class Console:
                 self.gaInstance = GA(self.env.prepackAlgorithm(self.dataset), self.rootDir,)
         self.gaInstance.run()
 
-    def train(self, maxTimeSeconds: int = 0, overwrite: bool = False, gui: bool = False):
+    def train(self, maxTimeSeconds: int = 0, overwrite: bool = False, gui: bool = False, processes: int = None):
         """
         Esegue delle partite per creare il dataset
 
@@ -199,12 +229,21 @@ class Console:
             Se True, sovrascrive un eventuale dataset gia' esistente, altrimenti lo amplia
         gui: bool = False
            Se true, mostra l' interfaccia di gioco
+        processes: int = None
+            se diverso da None, le partite vengono giocate in parallelo da `processes` processi (0 = numero di CPU),
+            ognuno con un proprio seed, e le righe prodotte vengono unite nel dataset eliminando i duplicati.
+            Non compatibile con la gui
         """
         if gui:
             Gui.config(speed=20)
         logging.info(f"Starting the training of max {self.env.maxDataSize} records, for {maxTimeSeconds}s")
         datasetPath = os.path.join(self.rootDir, _DATASET_NAME)
         logger = Logger(datasetPath, self.env.features, self.env.extractor, overwrite)
+        if processes is not None and not gui:
+            self._trainParallel(logger, maxTimeSeconds, processes or os.cpu_count())
+            logger.__del__()
+            self.dataset = self._loadDataset()
+            return
         gi = self.env.newGame()
         start = time.time()
         while len(logger) <= self.env.maxDataSize and (maxTimeSeconds == 0 or time.time() - start < maxTimeSeconds):
@@ -219,7 +258,66 @@ class Console:
                 logging.warning("Game over during training. Recovering...")
                 gi = self.env.newGame()
         logger.__del__()
-        self.dataset = pandas.read_csv(datasetPath, index_col=0)
+        self.dataset = self._loadDataset()
+
+    def _loadDataset(self) -> pandas.DataFrame:
+        """
+        Carica il dataset dalla sua copia a colonne (vedi training.columnar), che viene ricreata dal dataset.csv se manca, non e' aggiornata
+        o e' stata salvata con features diverse da quelle dell'ambiente.
+        Il dataset.csv resta la fonte dei dati: il Logger scrive solo il csv, quindi dopo ogni training la copia viene ricreata.
+        Il dataset ha sempre gli stessi tipi: colonne numeriche secondo le features dell'ambiente, colonne `category` per le altre
+
+        Return
+        ------
+        pandas.DataFrame: il dataset
+        """
+        datasetPath = os.path.join(self.rootDir, _DATASET_NAME)
+        columnarPath = os.path.join(self.rootDir, _COLUMNAR_DATASET_NAME)
+        if not columnar.isUpToDate(columnarPath, datasetPath, self.env.features):
+            columnar.save(pandas.read_csv(datasetPath, index_col=0), columnarPath, self.env.features)
+        return columnar.load(columnarPath)
+
+    def _trainParallel(self, logger: Logger, maxTimeSeconds: int, processes: int):
+        """
+        Modalita' parallela di `train`: ogni task gioca _TRAIN_STEPS passi con il trainer, partendo da un seed indipendente,
+        e restituisce le righe prodotte. Le righe vengono unite nel dataset da questo processo tramite il logger, che elimina i duplicati
+        """
+        seeds = np.random.SeedSequence()
+        start = time.time()
+        with multiprocessing.Pool(processes, initializer=Console._initWorker, initargs=(self.env,)) as pool:
+            # vengono mantenuti al piu' 2 task per processo in esecuzione: i nuovi task vengono lanciati man mano che i precedenti terminano
+            pending = deque(pool.apply_async(Console._trainJob, [int(s.generate_state(1)[0]), _TRAIN_STEPS]) for s in seeds.spawn(2 * processes))
+            while len(logger) <= self.env.maxDataSize and (maxTimeSeconds == 0 or time.time() - start < maxTimeSeconds):
+                for record in pending.popleft().get():
+                    logger.add(record)
+                    if len(logger) > self.env.maxDataSize:
+                        break
+                pending.append(pool.apply_async(Console._trainJob, [int(seeds.spawn(1)[0].generate_state(1)[0]), _TRAIN_STEPS]))
+
+    @staticmethod
+    def _initWorker(env: Environment):
+        """
+        Initializer dei processi usati da `_trainParallel` e `performance`: installa l'ambiente una sola volta per processo
+        """
+        _workerEnv["env"] = env
+
+    @staticmethod
+    def _trainJob(seed: int, steps: int) -> list[str]:
+        """
+        Funzione usata per la multiprogrammazione: gioca `steps` passi con il trainer dell'ambiente installato nel processo
+        e restituisce le righe del dataset prodotte, senza duplicati
+        """
+        env: Environment = _workerEnv["env"]
+        random.seed(seed)
+        records = dict()  # usato come insieme ordinato
+        gi = env.newGame()
+        for _ in range(steps):
+            action = env.trainer.query(gi)
+            records[recordLine(env.features, env.extractor, gi, action)] = None
+            gameEngine.update(gi, action)
+            if gi.isGameOver:
+                gi = env.newGame()
+        return list(records)
 
     def play(self, player: PlayerI, gui: bool = True, log: bool = False):
         """
@@ -236,8 +334,15 @@ class Console:
         """
         if gui:
             Gui.config(speed=30)
-        gi = self.env.newGame()
         logger = Logger(os.path.join(self.rootDir, _DATASET_NAME), self.env.features, self.env.extractor) if log else None
+        return Console._playGame(self.env, player, gui, logger)
+
+    @staticmethod
+    def _playGame(env: Environment, player: PlayerI, gui: bool = False, logger: Logger = None) -> int:
+        """
+        Implementazione di `play`, utilizzabile anche dai processi di `performance` (che non hanno una Console)
+        """
+        gi = env.newGame()
         steps = 0
         maxsteps = gi.height * gi.width
         score = 0
@@ -270,22 +375,140 @@ class Console:
             l'indice della history a cui fermarsi (quindi l'individuo all'indice 'last' non viene fatto giocare).
             Se lasciato vuoto, eseguira' fino all'ultimo elemento della history
         """
-        history = self.gaInstance.getHistory()
+        history = self.gaInstance.history
         if last is None:
             last = len(history)
-        for i in history[first:last]:
-            player = TreeAgent(i[2], self.env.extractor)
+        for k in range(first, last):
+            i = history[k]  # gli alberi vengono letti uno alla volta, quando servono
+            player = TreeAgent(i[2], self.env.extractor, rowExtractor=self.env.rowExtractor)
             points = self.play(player=player, gui=True)
             print(f"[environment.replay] generation:{i[0]}, fitness:{i[1]}, points={points}")
 
-    def performance(self):
+    def playBatch(self, player: PlayerI, games: int = 100, seed: int = None) -> np.ndarray:
+        """
+        Esegue piu' partite con un dato giocatore, facendole avanzare insieme con il batchEngine.
+        Ogni partita termina come in `play`: per game over o dopo height * width passi senza aumentare il punteggio
+
+        Parameters
+        ----------
+        player: PlayerI
+            un player. Se fornisce il metodo `queryBatch(batch, games)` (come TreeAgent) viene interrogato una sola volta per passo
+        games: int = 100
+            numero di partite
+        seed: int = None
+            seed usato per posizionare il cibo
+
+        Return
+        ------
+        numpy.ndarray: punteggio finale di ogni partita
+        """
+        return Console._playBatch(self.env, player, games, seed)
+
+    @staticmethod
+    def _playBatch(env: Environment, player: PlayerI, games: int, seed: int) -> np.ndarray:
+        """
+        Implementazione di `playBatch`, utilizzabile anche dai processi di `performance` (che non hanno una Console)
+        """
+        batch = GameBatch(env.newGame(), games, seed)
+        maxsteps = batch.height * batch.width
+        steps = np.zeros(games, dtype=np.int64)  # passi senza aumentare il punteggio
+        score = batch.score.copy()
+        active = batch.active()
+        while active.size > 0:
+            if hasattr(player, "queryBatch"):
+                actions = player.queryBatch(batch, active)
+            else:
+                # le partite vengono passate al player a gruppi: le istanze create per ogni gruppo vengono liberate subito,
+                # senza accumularsi in memoria (e nelle raccolte del garbage collector) per tutte le partite
+                actions = list()
+                for k in range(0, active.size, _QUERY_CHUNK):
+                    actions.extend(player.query(gi).value for gi in batch.views(active[k:k + _QUERY_CHUNK]))
+            changed = batch.score[active] != score[active]
+            steps[active] = np.where(changed, 0, steps[active] + 1)
+            score[active] = batch.score[active]
+            batchEngine.update(batch, actions, active)
+            active = active[~batch.isGameOver[active] & (steps[active] < maxsteps)]
+        return batch.score
+
+    def performance(self, games: int = 100, processes: int = None, gamesPerJob: int = None, seed: int = None) -> pandas.DataFrame:
+        """
+        Fa giocare `games` partite al miglior individuo di ogni generazione e ne stampa il punteggio medio.
+        In modalita' sequenziale, se l'ambiente ha un `batchExtractor` le partite vengono giocate insieme con `playBatch`,
+        altrimenti una alla volta con `play`.
+        In modalita' parallela le partite di ogni generazione vengono divise in task (generazione, seed) da `gamesPerJob` partite,
+        eseguiti da un pool di processi a cui vengono inviati solo gli alberi compilati. Ogni task gioca le sue partite come in modalita' sequenziale
+
+        Parameters
+        ----------
+        games: int = 100
+            numero di partite per ogni generazione
+        processes: int = None
+            se diverso da None, numero di processi usati per giocare le partite (0 = numero di CPU)
+        gamesPerJob: int = None
+            numero di partite giocate da ogni task in modalita' parallela. Se None, ogni task gioca tutte le partite di una generazione
+            (con un `batchExtractor`, task piu' grandi sfruttano meglio le interrogazioni in blocco dell'agente)
+        seed: int = None
+            seed da cui derivare i seed dei task in modalita' parallela, per rendere ripetibile la valutazione
+
+        Return
+        ------
+        pandas.DataFrame: per ogni generazione (una riga per elemento della history), fitness e distribuzione dei punteggi
+            (colonne generation, fitness, mean, p50, p95, max)
+        """
         history = self.gaInstance.getHistory()
-        for i in history:
-            player = TreeAgent(i[2], self.env.extractor)
-            points = 0
-            for _ in range(100):
-                points += self.play(player=player, gui=False)
-            print(f"[environment.replay] generation:{i[0]}, fitness:{i[1]}, avgPoints={points / 100}")
+        if processes is None:
+            scores = list()
+            for i in history:
+                player = TreeAgent(i[2], self.env.extractor, self.env.batchExtractor, self.env.rowExtractor)
+                if self.env.batchExtractor is not None:
+                    scores.append(self.playBatch(player, games))
+                else:
+                    scores.append(np.array([self.play(player=player, gui=False) for _ in range(games)]))
+        else:
+            scores = [list() for _ in history]
+            seeds = np.random.SeedSequence(seed)
+            gamesPerJob = gamesPerJob or games
+            with multiprocessing.Pool(processes or os.cpu_count(), initializer=Console._initWorker, initargs=(self.env,)) as pool:
+                jobs = list()
+                for row, i in enumerate(history):
+                    compiledTree = i[2].compile()
+                    for first in range(0, games, gamesPerJob):
+                        jobSeed = int(seeds.spawn(1)[0].generate_state(1)[0])
+                        jobs.append((row, compiledTree, jobSeed, min(gamesPerJob, games - first)))
+                for row, points in pool.imap_unordered(Console._performanceJob, jobs):
+                    scores[row].append(points)
+            scores = [np.concatenate(s) for s in scores]
+
+        stats = list()
+        for i, points in zip(history, scores):
+            p50, p95 = np.percentile(points, [50, 95])
+            stats.append([i[0], i[1], points.mean(), p50, p95, points.max()])
+            print(f"[environment.performance] generation:{i[0]}, fitness:{i[1]}, avgPoints={points.mean()}, "
+                  f"p50={p50}, p95={p95}, maxPoints={points.max()}")
+        return pandas.DataFrame(stats, columns=["generation", "fitness", "mean", "p50", "p95", "max"])
+
+    @staticmethod
+    def _performanceJob(job: tuple[int, CompiledTree, int, int]) -> tuple[int, np.ndarray]:
+        """
+        Funzione usata per la multiprogrammazione: fa giocare all'albero compilato le partite di un task di `performance`
+
+        Parameters
+        ----------
+        job: tuple[int, CompiledTree, int, int]
+            (riga della history, albero compilato, seed, numero di partite)
+
+        Return
+        ------
+        tuple[int, numpy.ndarray]: riga della history e punteggio finale di ogni partita
+        """
+        env: Environment = _workerEnv["env"]
+        row, compiledTree, seed, games = job
+        player = TreeAgent(compiledTree, env.extractor, env.batchExtractor, env.rowExtractor)
+        if env.batchExtractor is not None:
+            return row, Console._playBatch(env, player, games, seed)
+        # come in modalita' sequenziale, senza `batchExtractor` le partite vengono giocate una alla volta
+        random.seed(seed)
+        return row, np.array([Console._playGame(env, player) for _ in range(games)])
 
     def printDecisionTree(self, generationNumber: int = None):
         """
@@ -299,8 +522,7 @@ class Console:
         """
         # TODO: "generationNumber" puo' non coincidere con la reale generazione
         # (per evitare un enorme file history e' possibile eliminare righe del file senza comprometterlo)
-        generation = self.gaInstance.getHistory()[-1 if generationNumber is None else generationNumber]
-        tree = generation[2]
+        tree = self.gaInstance.history.tree(-1 if generationNumber is None else generationNumber)
         label = "last" if generationNumber is None else str(generationNumber)
         tree.printToFile(os.path.join(self.rootDir, f"bestTreeOfGen_{label}"))
 
@@ -5,10 +5,12 @@ import sys,os
 """
 sys.path.append(os.path.dirname(os.path.realpath(__file__))+"/..")
 
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 
 from environment import Environment, Console
+from game.batchEngine import GameBatch
 from game.gameInstance import GameInstance
 from player.simpleReactiveAgent import LAgent
 from training import geneticAlgorithm
@@ -36,6 +38,14 @@ def fExtractor(g: GameInstance):
             'direction': g.direction}
 
 
+def fBatchExtractor(b: GameBatch, games: np.ndarray):
+    return {'snake[0]': b.snakePos[games, 0],
+            'snake[1]': b.snakePos[games, 1],
+            'food[0]': b.foodPos[games, 0],
+            'food[1]': b.foodPos[games, 1],
+            'direction': b.direction[games]}
+
+
 def mutation(*args):
     pass
 
@@ -57,7 +67,7 @@ def algorithm(dataset: pd.DataFrame):
 
 env.setTrainer(trainer=LAgent(), maxDataSize=30000)
 env.setAlgorithm(algorithm)
-env.setFeatures(features, fExtractor)
+env.setFeatures(features, fExtractor, fBatchExtractor)
 env.setGameEnv(gi)
 
 if __name__ == "__main__":
@@ -48,6 +48,18 @@ def fExtractor(g: GameInstance):
     return values
 
 
+# colonna di ogni cella nella riga delle features (stesso ordine di features.columns())
+cellColumn = [[features.columns().index(f"[{x}:{y}]") for y in range(gi.height)] for x in range(gi.width)]
+
+
+def fRow(g: GameInstance, row):
+    row[:] = 'w'
+    row[cellColumn[g.foodPos[0]][g.foodPos[1]]] = 'f'
+    for xi, yi in g.snakeBody:
+        row[cellColumn[xi][yi]] = 'b'
+    row[cellColumn[g.snakePos[0]][g.snakePos[1]]] = 'h'
+
+
 def mutation(*args):
     pass
 
@@ -74,7 +86,7 @@ def algorithm(dataset: pd.DataFrame):
 
 env.setTrainer(trainer=LAgent(), maxDataSize=30000)
 env.setAlgorithm(algorithm)
-env.setFeatures(features, fExtractor)
+env.setFeatures(features, fExtractor, rowFiller=fRow)
 env.setGameEnv(gi)
 
 if __name__ == "__main__":
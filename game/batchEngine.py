@@ -0,0 +1,202 @@
+from collections import deque
+
+import numpy as np
+
+from game.gameInstance import Actions, GameInstance
+
+"""
+Il batchEngine fa avanzare in parallelo N partite indipendenti di Snake, con le stesse regole del gameEngine,
+mantenendo lo stato di tutte le partite in array NumPy
+"""
+
+# spostamento (x, y) della testa per ogni direzione: 0 destra, 1 su, 2 sinistra, 3 giu'
+_MOVES = np.array([[1, 0], [0, -1], [-1, 0], [0, 1]], dtype=np.int64)
+
+# variazione della direzione per ogni azione (indicizzato per Actions.value)
+_TURNS = np.zeros(max(a.value for a in Actions) + 1, dtype=np.int64)
+_TURNS[Actions.LEFT.value] = 1
+_TURNS[Actions.RIGHT.value] = -1
+
+
+class GameBatch:
+    """
+    Stato di N partite di Snake che avanzano insieme (vedi `update`).
+    Il corpo di ogni serpente e' un buffer circolare: `body[g, headIndex[g]]` e' la testa, seguita dai `length[g] - 1` blocchi successivi.
+    `occupancy[g, y, x]` conta i blocchi del serpente nella cella (x, y), cosi' collisioni e generazione del cibo non scorrono il corpo
+
+    Methods
+    -------
+    view(g: int) -> GameInstance:
+        restituisce lo stato della partita g come GameInstance
+    views(games: numpy.ndarray = None) -> list[GameInstance]:
+        restituisce lo stato di piu' partite come GameInstance
+    active() -> numpy.ndarray:
+        restituisce gli indici delle partite non terminate
+    """
+
+    def __init__(self, template: GameInstance, n: int, seed: int = None):
+        """
+        Parameters
+        ----------
+        template: GameInstance
+            stato iniziale (e configurazione) comune a tutte le partite
+        n: int
+            numero di partite
+        seed: int = None
+            seed del generatore usato per posizionare il cibo
+        """
+        self.n = n
+        self.width = template.width
+        self.height = template.height
+        self.grow = template.grow
+        self.pacmanWorld = template.pacmanWorld
+        self.rng = np.random.default_rng(seed)
+
+        capacity = self.width * self.height + 1  # il serpente non puo' occupare piu' celle di quelle della griglia
+        self.body = np.zeros((n, capacity, 2), dtype=np.int64)
+        self.body[:, :len(template.snakeBody)] = template.snakeBody
+        self.headIndex = np.zeros(n, dtype=np.int64)
+        self.length = np.full(n, len(template.snakeBody), dtype=np.int64)
+        self.occupancy = np.zeros((n, self.height, self.width), dtype=np.int16)
+        for x, y in template.snakeBody:
+            self.occupancy[:, y, x] += 1
+
+        self.snakePos = np.tile(np.array(template.snakePos, dtype=np.int64), (n, 1))
+        self.foodPos = np.tile(np.array(template.foodPos, dtype=np.int64), (n, 1))
+        self.foodSpawn = np.full(n, template.foodSpawn, dtype=bool)
+        self.direction = np.full(n, template.direction, dtype=np.int64)
+        self.score = np.full(n, template.score, dtype=np.int64)
+        self.isGameOver = np.full(n, template.isGameOver, dtype=bool)
+
+    def __len__(self):
+        return self.n
+
+    def active(self) -> np.ndarray:
+        """
+        Restituisce gli indici delle partite non terminate
+        """
+        return np.flatnonzero(~self.isGameOver)
+
+    def view(self, g: int) -> GameInstance:
+        """
+        Restituisce lo stato della partita g come GameInstance, utilizzabile dagli estrattori di features e dagli agenti
+
+        Parameters
+        ----------
+        g: int
+            indice della partita
+
+        Return
+        ------
+        GameInstance: copia dello stato della partita
+        """
+        return self.views([g])[0]
+
+    def views(self, games: np.ndarray = None) -> list[GameInstance]:
+        """
+        Come `view`, ma per piu' partite: gli array vengono convertiti una sola volta per tutte le partite richieste
+
+        Parameters
+        ----------
+        games: numpy.ndarray = None
+            indici delle partite. Se None, vengono restituite tutte le partite
+
+        Return
+        ------
+        list[GameInstance]: copia dello stato di ogni partita richiesta
+        """
+        games = np.arange(self.n) if games is None else np.asarray(games, dtype=np.int64)
+        lengths = self.length[games].tolist()
+        indexes = (self.headIndex[games, None] + np.arange(max(lengths, default=0))) % self.body.shape[1]
+        bodies = self.body[games[:, None], indexes].tolist()
+        result = list()
+        for body, length, snakePos, foodPos, foodSpawn, direction, score, isGameOver in zip(
+                bodies, lengths, self.snakePos[games].tolist(), self.foodPos[games].tolist(), self.foodSpawn[games].tolist(),
+                self.direction[games].tolist(), self.score[games].tolist(), self.isGameOver[games].tolist()):
+            gi = GameInstance()
+            gi.grow = self.grow
+            gi.pacmanWorld = self.pacmanWorld
+            gi.width = self.width
+            gi.height = self.height
+            gi.size = self.width, self.height
+            gi.foodSpawn = foodSpawn
+            gi.snakeBody = deque(body[:length])
+            gi.snakePos = snakePos
+            gi.foodPos = foodPos
+            gi.direction = direction
+            gi.score = score
+            gi.isGameOver = isGameOver
+            result.append(gi)
+        return result
+
+
+def update(batch: GameBatch, actions: np.ndarray, games: np.ndarray = None) -> None:
+    """
+    Aggiorna le partite di un GameBatch con le rispettive azioni, applicando le stesse regole di gameEngine.update.
+    Le partite gia' terminate non vengono aggiornate
+
+    Parameters
+    ----------
+    batch: GameBatch
+        partite da aggiornare
+    actions: numpy.ndarray
+        valore (Actions.value) dell'azione da effettuare in ogni partita indicata da `games`
+    games: numpy.ndarray = None
+        indici delle partite da aggiornare. Se None, vengono aggiornate tutte le partite
+    """
+    games = np.arange(batch.n) if games is None else np.asarray(games, dtype=np.int64)
+    actions = np.asarray(actions, dtype=np.int64)
+    alive = ~batch.isGameOver[games]
+    games = games[alive]
+    actions = actions[alive]
+    if games.size == 0:
+        return
+
+    # Validate direction
+    batch.direction[games] = (batch.direction[games] + _TURNS[actions]) % 4
+
+    # Update snake position
+    head = batch.snakePos[games] + _MOVES[batch.direction[games]]
+
+    # Bounds
+    out = (head[:, 0] < 0) | (head[:, 0] >= batch.width) | (head[:, 1] < 0) | (head[:, 1] >= batch.height)
+    if batch.pacmanWorld:
+        head[:, 0] %= batch.width
+        head[:, 1] %= batch.height
+    else:
+        # come nel gameEngine la testa esce dalla griglia, ma il corpo della partita terminata non viene piu' aggiornato
+        batch.snakePos[games[out]] = head[out]
+        batch.isGameOver[games[out]] = True
+        games = games[~out]
+        head = head[~out]
+    batch.snakePos[games] = head
+
+    # Snake body mechanism
+    eat = np.all(head == batch.foodPos[games], axis=1)
+    batch.foodSpawn[games[eat]] = False
+    batch.score[games[eat]] += 1
+    capacity = batch.body.shape[1]
+    keep = eat & batch.grow  # partite in cui il serpente si allunga: la coda non viene rimossa
+    tails = batch.body[games[~keep], (batch.headIndex[games[~keep]] + batch.length[games[~keep]] - 1) % capacity]
+    batch.occupancy[games[~keep], tails[:, 1], tails[:, 0]] -= 1
+    batch.length[games[keep]] += 1
+    batch.headIndex[games] = (batch.headIndex[games] - 1) % capacity
+    batch.body[games, batch.headIndex[games]] = head
+
+    # Self hit: la testa entra in una cella ancora occupata dal corpo
+    batch.isGameOver[games[batch.occupancy[games, head[:, 1], head[:, 0]] > 0]] = True
+    batch.occupancy[games, head[:, 1], head[:, 0]] += 1
+
+    # Food Spawn: la nuova posizione e' scelta uniformemente tra le celle libere
+    spawn = games[~batch.foodSpawn[games]]
+    if spawn.size > 0:
+        free = (batch.occupancy[spawn] == 0).reshape(spawn.size, -1)
+        freeCount = free.sum(axis=1)
+        full = freeCount == 0
+        batch.isGameOver[spawn[full]] = True  # griglia piena: non c'e' spazio per altro cibo
+        spawn, free, freeCount = spawn[~full], free[~full], freeCount[~full]
+        k = (batch.rng.random(spawn.size) * freeCount).astype(np.int64)  # indice della cella libera scelta
+        cells = np.argmax(np.cumsum(free, axis=1) > k[:, None], axis=1)
+        batch.foodPos[spawn, 0] = cells % batch.width
+        batch.foodPos[spawn, 1] = cells // batch.width
+        batch.foodSpawn[spawn] = True
@@ -1,7 +1,6 @@
 #   SNAKE GAME
 #   Author : Apaar Gupta (@apaar97)
 #   Python 3.5.2 Pygame
-import random
 from game.gameInstance import Actions, GameInstance
 
 """
@@ -55,24 +54,21 @@ def update(gi: GameInstance, action: Actions) -> None:
             gi.isGameOver = True
             
     # Snake body mechanism
-    gi.snakeBody.insert(0, list(gi.snakePos))
-    if gi.snakePos == gi.foodPos:
+    eat = gi.snakePos == gi.foodPos
+    if eat:
         gi.foodSpawn = False
         gi.score += 1
-        if not gi.grow:
-            gi.snakeBody.pop()
-    else:
-        gi.snakeBody.pop()
-    
+    # Self hit: la testa entra in una cella ancora occupata dal corpo (dopo l'eventuale rimozione della coda)
+    selfHit = gi.moveBody(grow=eat and gi.grow)
+
     # Food Spawn
     if not gi.foodSpawn:
-        while True:
-            gi.foodPos = [random.randrange(0, gi.width), random.randrange(0, gi.height)]
-            if gi.foodPos not in gi.snakeBody:
-                break
-        gi.foodSpawn = True
+        foodPos = gi.randomFreeCell()
+        if foodPos is None:
+            gi.isGameOver = True  # il serpente occupa tutto il mondo: non c'e' spazio per altro cibo
+        else:
+            gi.foodPos = foodPos
+            gi.foodSpawn = True
 
-    # Self hit
-    for block in gi.snakeBody[1:]:
-        if gi.snakePos == block:
-            gi.isGameOver = True
+    if selfHit:
+        gi.isGameOver = True
@@ -1,4 +1,8 @@
-from dataclasses import dataclass
+from __future__ import annotations
+
+import random
+from collections import deque
+from dataclasses import dataclass, field
 from enum import Enum, auto
 from typing import Tuple
 
@@ -12,10 +16,38 @@ class Actions(Enum):
     FORWARD = auto()
 
 
-@dataclass(init=False)
+# Stato di una partita salvato da GameInstance.snapshot:
+# (snakePos, snakeBody, foodPos, direction, score, isGameOver, foodSpawn), con posizioni e corpo come tuple
+Snapshot = tuple[tuple[int, int], tuple[tuple[int, int], ...], tuple[int, int], int, int, bool, bool]
+
+
+@dataclass(init=False, slots=True)
 class GameInstance:
     """
-    GameInstance mantiene tutte le informazioni relative a una partita di Snake
+    GameInstance mantiene tutte le informazioni relative a una partita di Snake.
+    Oltre ai campi pubblici, mantiene un indice delle celle occupate dal corpo del serpente e delle celle libere,
+    usato dal gameEngine per controllare le collisioni e posizionare il cibo in tempo costante.
+    L'indice viene ricostruito automaticamente se `snakeBody`, `width` o `height` vengono riassegnati,
+    mentre le modifiche al corpo fatte fuori dal gameEngine devono usare `occupy` e `vacate`
+
+    Methods
+    -------
+    isOccupied(pos: list[int]) -> bool:
+        True se la cella e' occupata dal corpo del serpente
+    occupy(pos: list[int]) -> None:
+        registra un blocco del serpente nella cella
+    vacate(pos: list[int]) -> None:
+        rimuove un blocco del serpente dalla cella
+    moveBody(grow: bool) -> bool:
+        sposta il corpo del serpente sulla posizione della testa
+    randomFreeCell() -> list[int] | None:
+        restituisce una cella libera scelta uniformemente
+    snapshot() -> Snapshot:
+        restituisce una copia immutabile dello stato della partita
+    restore(snapshot: Snapshot) -> None:
+        riporta la partita allo stato salvato
+    clone() -> GameInstance:
+        restituisce una copia indipendente della partita
     """
     foodSpawn: bool
     grow: bool
@@ -26,12 +58,19 @@ class GameInstance:
 
     # Game status
     snakePos: list[int]
-    snakeBody: list[list[int]]
+    snakeBody: deque[list[int]]
     foodPos: list[int]
     direction: int
     score: int
     isGameOver: bool
 
+    # Indice delle celle (costruito da `indexCells`). Una cella (x, y) ha indice y * width + x
+    _grid: list[int] = field(default=None, repr=False, compare=False)        # numero di blocchi del serpente in ogni cella
+    _free: list[int] = field(default=None, repr=False, compare=False)        # celle libere, in ordine qualsiasi
+    _freeIndex: list[int] = field(default=None, repr=False, compare=False)   # posizione di ogni cella libera in `_free`
+    _indexedBody: deque = field(default=None, repr=False, compare=False)     # corpo a cui si riferisce l'indice
+    _indexedSize: tuple = field(default=None, repr=False, compare=False)     # (width, height) a cui si riferisce l'indice
+
     def __init__(self) -> None:
         # Constants
         self.foodSpawn: bool = False
@@ -43,12 +82,191 @@ class GameInstance:
 
         # Game status
         self.snakePos: list[int] = [3, 5]
-        self.snakeBody: list[list[int]] = [[3, 5], [2, 5], [1, 5]]
+        self.snakeBody: deque[list[int]] = deque([[3, 5], [2, 5], [1, 5]])  # il primo blocco e' la testa
         self.foodPos: list[int] = [6, 5]
         self.direction: int = 0
         self.score: int = 0
         self.isGameOver: bool = False
 
+        self._grid = None
+        self._free = None
+        self._freeIndex = None
+        self._indexedBody = None
+        self._indexedSize = None
+
+    def indexCells(self) -> None:
+        """
+        Costruisce l'indice delle celle a partire da `snakeBody`, se non e' gia' aggiornato.
+        Viene chiamato dal gameEngine prima di ogni mossa: l'indice va ricostruito solo se corpo o dimensioni del mondo sono stati riassegnati
+        """
+        if self._indexedBody is self.snakeBody and self._indexedSize == (self.width, self.height):
+            return
+        if not isinstance(self.snakeBody, deque):
+            self.snakeBody = deque(self.snakeBody)
+        cells = self.width * self.height
+        self._grid = [0] * cells
+        self._free = list(range(cells))
+        self._freeIndex = list(range(cells))
+        self._indexedBody = self.snakeBody
+        self._indexedSize = (self.width, self.height)
+        for block in self.snakeBody:
+            self._occupy(self._cell(block))
+
+    def _cell(self, pos: list[int]) -> int:
+        """
+        Indice della cella in posizione `pos`, -1 se la posizione e' fuori dal mondo
+        """
+        x, y = pos
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return y * self.width + x
+        return -1
+
+    def isOccupied(self, pos: list[int]) -> bool:
+        """
+        True se la cella in posizione `pos` e' occupata dal corpo del serpente
+        """
+        self.indexCells()
+        c = self._cell(pos)
+        return c >= 0 and self._grid[c] > 0
+
+    def occupy(self, pos: list[int]) -> None:
+        """
+        Registra nell'indice un blocco del serpente nella cella in posizione `pos` (le posizioni fuori dal mondo vengono ignorate)
+        """
+        self.indexCells()
+        self._occupy(self._cell(pos))
+
+    def _occupy(self, c: int) -> None:
+        if c < 0:
+            return
+        if self._grid[c] == 0:
+            # rimuove la cella da `_free` spostando al suo posto l'ultima cella libera
+            i = self._freeIndex[c]
+            last = self._free.pop()
+            if last != c:
+                self._free[i] = last
+                self._freeIndex[last] = i
+        self._grid[c] += 1
+
+    def vacate(self, pos: list[int]) -> None:
+        """
+        Rimuove dall'indice un blocco del serpente dalla cella in posizione `pos` (le posizioni fuori dal mondo vengono ignorate)
+        """
+        self.indexCells()
+        self._vacate(self._cell(pos))
+
+    def _vacate(self, c: int) -> None:
+        if c < 0:
+            return
+        self._grid[c] -= 1
+        if self._grid[c] == 0:
+            self._freeIndex[c] = len(self._free)
+            self._free.append(c)
+
+    def moveBody(self, grow: bool) -> bool:
+        """
+        Aggiunge al corpo del serpente un blocco nella posizione della testa (`snakePos`) e, se `grow` e' False, ne rimuove la coda,
+        aggiornando l'indice delle celle
+
+        Parameters
+        ----------
+        grow: bool
+            se True la coda non viene rimossa e il serpente si allunga
+
+        Return
+        ------
+        bool: True se la testa e' entrata in una cella occupata dal resto del corpo
+        """
+        self.indexCells()
+        width = self.width
+        grid = self._grid
+        if not grow:
+            x, y = self.snakeBody.pop()
+            if 0 <= x < width and 0 <= y < self.height:
+                tail = y * width + x
+                grid[tail] -= 1
+                if grid[tail] == 0:
+                    self._freeIndex[tail] = len(self._free)
+                    self._free.append(tail)
+        x, y = self.snakePos
+        self.snakeBody.appendleft([x, y])
+        if not (0 <= x < width and 0 <= y < self.height):
+            return False
+        head = y * width + x
+        if grid[head] > 0:
+            grid[head] += 1
+            return True
+        self._occupy(head)
+        return False
+
+    def randomFreeCell(self) -> list[int] | None:
+        """
+        Restituisce una cella non occupata dal serpente, scelta uniformemente tra quelle libere. None se non ci sono celle libere
+        """
+        self.indexCells()
+        if len(self._free) == 0:
+            return None
+        c = random.choice(self._free)
+        return [c % self.width, c // self.width]
+
+    def snapshot(self) -> Snapshot:
+        """
+        Restituisce una copia immutabile dello stato della partita (le configurazioni del mondo non sono incluse),
+        utile per esplorare piu' mosse a partire dallo stesso stato e tornare indietro con `restore`
+
+        Return
+        ------
+        Snapshot: stato della partita
+        """
+        return (tuple(self.snakePos), tuple(map(tuple, self.snakeBody)), tuple(self.foodPos),
+                self.direction, self.score, self.isGameOver, self.foodSpawn)
+
+    def restore(self, snapshot: Snapshot) -> None:
+        """
+        Riporta la partita allo stato salvato con `snapshot`. L'indice delle celle viene ricostruito alla mossa successiva
+
+        Parameters
+        ----------
+        snapshot: Snapshot
+            stato restituito da `snapshot`
+        """
+        snakePos, snakeBody, foodPos, self.direction, self.score, self.isGameOver, self.foodSpawn = snapshot
+        self.snakePos = list(snakePos)
+        self.snakeBody = deque(map(list, snakeBody))
+        self.foodPos = list(foodPos)
+
+    def clone(self) -> GameInstance:
+        """
+        Restituisce una copia indipendente della partita, comprese le configurazioni del mondo e l'indice delle celle.
+        Equivale a copy.deepcopy, ma copia direttamente i campi invece di visitare ricorsivamente l'oggetto
+
+        Return
+        ------
+        GameInstance: copia della partita
+        """
+        gi = GameInstance.__new__(GameInstance)
+        gi.foodSpawn = self.foodSpawn
+        gi.grow = self.grow
+        gi.pacmanWorld = self.pacmanWorld
+        gi.width = self.width
+        gi.height = self.height
+        gi.size = self.size
+        gi.snakePos = self.snakePos.copy()
+        gi.snakeBody = deque([x, y] for x, y in self.snakeBody)
+        gi.foodPos = self.foodPos.copy()
+        gi.direction = self.direction
+        gi.score = self.score
+        gi.isGameOver = self.isGameOver
+        if self._indexedBody is self.snakeBody:
+            gi._grid = self._grid.copy()
+            gi._free = self._free.copy()
+            gi._freeIndex = self._freeIndex.copy()
+            gi._indexedBody = gi.snakeBody
+            gi._indexedSize = self._indexedSize
+        else:
+            gi._grid = gi._free = gi._freeIndex = gi._indexedBody = gi._indexedSize = None
+        return gi
+
     # def __eq__(self, obj: object) -> bool:
     #     return (isinstance(obj, GameInstance)
     #             and self.snakePos == obj.snakePos
@@ -1,3 +1,4 @@
+import itertools
 import sys
 import pygame
 
@@ -128,7 +129,7 @@ class Gui:
         # Food
         pygame.draw.rect(cls._playSurface, foodColor, pygame.Rect(gi.foodPos[0] * delta, gi.foodPos[1] * delta, delta, delta))
         # Snake body
-        for pos in gi.snakeBody[1:]:
+        for pos in itertools.islice(gi.snakeBody, 1, None):
             pygame.draw.rect(cls._playSurface, snakeBodyColor, pygame.Rect(pos[0] * delta, pos[1] * delta, delta, delta))
         # Snake head
         pygame.draw.rect(cls._playSurface, snakeHeadColor, pygame.Rect(gi.snakePos[0] * delta, gi.snakePos[1] * delta, delta, delta))
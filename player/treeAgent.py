@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import numpy as np
+
+from game.batchEngine import GameBatch
 from game.gameInstance import Actions, GameInstance
-from training.decisionTree3 import DecisionTree, FeatureSet
+from training.decisionTree3 import CompiledTree, DecisionTree, FeatureSet, RowExtractor
 
 
 class TreeAgent:
@@ -14,11 +17,22 @@ class TreeAgent:
         Permette il caricamento di un albero decisionale a partire da un gile
     query(gi: GameInstance) -> Actions:
         interroga l'agente
+    queryBatch(batch: GameBatch, games: numpy.ndarray) -> numpy.ndarray:
+        interroga l'agente su piu' partite contemporaneamente
     """
+    BATCH_THRESHOLD = 128  # sotto questo numero di partite, visitare l'albero riga per riga costa meno di una visita con NumPy
 
-    def __init__(self, tree: DecisionTree, featureExtractor: callable[[GameInstance], dict[str, any]]) -> None:
-        self.tree = tree
+    def __init__(self, tree: DecisionTree | CompiledTree, featureExtractor: callable[[GameInstance], dict[str, any]],
+                 batchExtractor: callable[[GameBatch, np.ndarray], dict[str, np.ndarray]] = None,
+                 rowExtractor: RowExtractor = None) -> None:
+        # l'agente puo' essere costruito anche da un albero gia' compilato (ad esempio quello ricevuto da un altro processo),
+        # in tal caso `tree` e' None
+        self.tree = tree if isinstance(tree, DecisionTree) else None
+        self.compiledTree = tree.compile() if isinstance(tree, DecisionTree) else tree  # versione dell'albero usata per le interrogazioni
         self.extractor = featureExtractor
+        self.batchExtractor = batchExtractor  # vedi Environment.setFeatures
+        self.rowExtractor = rowExtractor      # se presente, le features vengono lette per posizione da una riga (vedi FeatureSet.compile)
+        self.rowTree = self.compiledTree.withColumns(rowExtractor.columns) if rowExtractor is not None else None
 
     @classmethod
     def load(cls, agentfile: str) -> TreeAgent:
@@ -49,9 +63,46 @@ class TreeAgent:
         ------
         Actions: azione da eseguire
         """
-        features = self.extractor(gi)
-        action = self.tree.predict(features)
+        if self.rowExtractor is not None:
+            row = self.rowExtractor(gi)
+            action = self.rowTree.predictRow(row)
+        else:
+            row = self.extractor(gi)
+            action = self.compiledTree.predict(row)
         if action is None:
+            features = self.rowExtractor.toDict(row) if self.rowExtractor is not None else row
             print(f"[ WARN ] null prediction with instance: {features}")
             return Actions.FORWARD
         return Actions[action]
+
+    def queryBatch(self, batch: GameBatch, games: np.ndarray) -> np.ndarray:
+        """
+        Interroga l'albero decisionale con gli stati di piu' partite di un GameBatch.
+        Se e' stato fornito un `batchExtractor` le features vengono lette dagli array del batch e classificate con un'unica visita dell'albero,
+        altrimenti ogni partita viene convertita in GameInstance e classificata come in `query`
+
+        Parameters
+        ----------
+        batch: GameBatch
+            partite in corso
+        games: numpy.ndarray
+            indici delle partite da interrogare
+
+        Return
+        ------
+        numpy.ndarray: valore (Actions.value) dell'azione da eseguire in ogni partita
+        """
+        if self.batchExtractor is not None and len(games) >= self.BATCH_THRESHOLD:
+            predictions = self.compiledTree.predictColumns(self.batchExtractor(batch, games))
+        else:
+            predictions = list()
+            for k in range(0, len(games), self.BATCH_THRESHOLD):
+                # le istanze vengono create a gruppi, cosi' vengono liberate subito
+                views = batch.views(games[k:k + self.BATCH_THRESHOLD])
+                if self.rowExtractor is not None:
+                    predictions.extend(self.rowTree.predictRow(self.rowExtractor(gi)) for gi in views)
+                else:
+                    predictions.extend(self.compiledTree.predict(self.extractor(gi)) for gi in views)
+        # come in `query`, una predizione nulla corrisponde all'azione FORWARD
+        values = {None: Actions.FORWARD.value} | {a.name: a.value for a in Actions}
+        return np.array([values[p] for p in predictions], dtype=np.int64)
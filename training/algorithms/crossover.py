@@ -1,9 +1,9 @@
-import copy
 import random
 
 import pandas as pd
 
 from training.algorithms.pruning import pruning
+from training.dataset import EncodedDataset
 from training.decisionTree3 import DecisionTree
 
 
@@ -12,13 +12,14 @@ class SemanticSubtreeCrossover:
     Semantic-based subtrees swapping crossover, common path
     """
 
-    def __init__(self, trainingSet: pd.DataFrame):
-        self.trainingSet = trainingSet
+    def __init__(self, trainingSet: pd.DataFrame | EncodedDataset):
+        self.trainingSet = EncodedDataset.of(trainingSet)
 
     def __call__(self, parents: list[DecisionTree]) -> list[DecisionTree]:
-        a = copy.deepcopy(parents[0])  # todo: necessario il deepcopy?
-        b = copy.deepcopy(parents[1])
-        randRow = self.trainingSet.sample(1).squeeze().to_dict()  # seleziona randomicamente un'istanza del dataset
+        # i figli condividono con i genitori i nodi non modificati dal crossover (vedi DecisionTree.fork)
+        a = parents[0].fork()
+        b = parents[1].fork()
+        randRow = self.trainingSet.row(random.randrange(len(self.trainingSet)))  # seleziona randomicamente un'istanza del dataset
         pathA: list[int] = [0]
         pathB: list[int] = [0]
         # ottiene il cammino del primo albero che classifica l'istanza selezionata
@@ -31,10 +32,9 @@ class SemanticSubtreeCrossover:
         pathB.pop()
         nodeIdA = random.choice(pathA)  # sceglie un nodo casuale del primo cammino
         nodeIdB = random.choice(pathB)  # sceglie un nodo casuale del secondo cammino
-        subTreeA = a.extract(nodeIdA)   # estrae il sottoalbero radicato nel primo nodo scelto
-        subTreeB = b.extract(nodeIdB)   # estrae il sottoalbero radicato nel secondo nodo scelto
-        appendedIdA = a.substitute(nodeIdA, subTreeB)  # sostituisce il sottoalbero del primo nodo con quello del secondo
-        appendedIdB = b.substitute(nodeIdB, subTreeA)  # sostituisce il sottoalbero del secondo nodo con quello del primo
+        # i genitori non vengono modificati: i sottoalberi da scambiare vengono copiati direttamente da loro
+        appendedIdA = a.graft(nodeIdA, parents[1], nodeIdB)  # sostituisce il sottoalbero del primo nodo con quello del secondo
+        appendedIdB = b.graft(nodeIdB, parents[0], nodeIdA)  # sostituisce il sottoalbero del secondo nodo con quello del primo
         pruning(a, appendedIdA)  # pruning primo albero
         pruning(b, appendedIdB)  # pruning secondo albero
         return [a, b]
@@ -45,13 +45,13 @@ class SemanticSubtreeCrossoverSameFeature:
     Semantic-based subtrees swapping crossover, common path chose nodes with same feature
     """
 
-    def __init__(self, trainingSet: pd.DataFrame):
-        self.trainingSet = trainingSet
+    def __init__(self, trainingSet: pd.DataFrame | EncodedDataset):
+        self.trainingSet = EncodedDataset.of(trainingSet)
 
     def __call__(self, parents: list[DecisionTree]) -> list[DecisionTree]:
-        a = copy.deepcopy(parents[0])
-        b = copy.deepcopy(parents[1])
-        randRow = self.trainingSet.sample(1).squeeze().to_dict()
+        a = parents[0].fork()
+        b = parents[1].fork()
+        randRow = self.trainingSet.row(random.randrange(len(self.trainingSet)))
         # i cammini dei due alberi vengono salvati su una struttura a dizionario con chiave: featureName e valore: lista di nodi con quella feature
         # in questo modo possiamo accedere rapidamente ai nodi che hanno una determinata feature
         walkA: dict[str, list[int]] = dict()
@@ -84,10 +84,8 @@ class SemanticSubtreeCrossoverSameFeature:
         feature = random.choice(list(walkB.keys()))
         nodeIdA = random.choice(walkA[feature])
         nodeIdB = random.choice(walkB[feature])
-        subTreeA = a.extract(nodeIdA)
-        subTreeB = b.extract(nodeIdB)
-        appendedIdA = a.substitute(nodeIdA, subTreeB)
-        appendedIdB = b.substitute(nodeIdB, subTreeA)
+        appendedIdA = a.graft(nodeIdA, parents[1], nodeIdB)
+        appendedIdB = b.graft(nodeIdB, parents[0], nodeIdA)
         pruning(a, appendedIdA)
         pruning(b, appendedIdB)
         return [a, b]
@@ -96,8 +94,8 @@ class SemanticSubtreeCrossoverSameFeature:
 class RandomNodeCrossover:
     @staticmethod
     def __call__(parents: list[DecisionTree]) -> list[DecisionTree]:
-        a = copy.deepcopy(parents[0])
-        b = copy.deepcopy(parents[1])
+        a = parents[0].fork()
+        b = parents[1].fork()
 
         ia = random.choice(list(a.nodes.keys()))
         na = a.nodes[ia]
@@ -111,7 +109,9 @@ class RandomNodeCrossover:
             ib = random.choice(list(b.nodes.keys()))
             nb = b.nodes[ib]
 
-        tempNode = copy.deepcopy(na)
+        na = a.writable(ia)
+        nb = b.writable(ib)
+        tempNode = na.copy()
         na.feature = nb.feature
         na.threshold = nb.threshold
         na.out = nb.out
@@ -119,9 +119,6 @@ class RandomNodeCrossover:
         nb.threshold = tempNode.threshold
         nb.out = tempNode.out
 
-        a.nodes[ia] = na
-        b.nodes[ib] = nb
-
         pruning(a, ia)
         pruning(b, ib)
         return [a, b]
@@ -134,12 +131,12 @@ class TestingCrossover:
 
     @staticmethod
     def __call__(parents: list[DecisionTree]) -> list[DecisionTree]:
-        a = copy.deepcopy(parents[0])
-        b = copy.deepcopy(parents[1])
+        a = parents[0].fork()
+        b = parents[1].fork()
         ia = random.choice(list(a.nodes.keys()))
         ib = random.choice(list(b.nodes.keys()))
-        a.nodes[ia].threshold = 0
-        b.nodes[ib].threshold = 0
+        a.writable(ia).threshold = 0
+        b.writable(ib).threshold = 0
         pruning(a, ia)
         pruning(b, ib)
         return [a, b]
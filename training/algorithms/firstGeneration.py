@@ -2,39 +2,53 @@ import multiprocessing
 
 import pandas as pd
 
-from training.decisionTree3 import FeatureSet
+from training.dataset import EncodedDataset, attach
+from training.decisionTree3 import DecisionTree, FeatureSet
 from training.id3 import id3
 
 
+def _sampleAndInduce(trainingSet: EncodedDataset, features: FeatureSet, frac: float) -> DecisionTree:
+    """
+    Esegue l'ID3 su un campione casuale del trainingSet. Usata dai processi del Pool: il campione viene estratto dal processo stesso,
+    cosi' il task contiene solo il riferimento al dataset condiviso
+    """
+    return id3(trainingSet, features, trainingSet.sample(frac))
+
+
 class Id3Generation:
     """
     Genera la prima popolazione usando l'algoritmo ID3
     """
-    def __init__(self, trainingSet: pd.DataFrame, features: FeatureSet, populationLen: int):
+    def __init__(self, trainingSet: pd.DataFrame | EncodedDataset, features: FeatureSet, populationLen: int):
         """
         Parameters
         ----------
-        trainingSet: pd.DataFrame
+        trainingSet: pd.DataFrame | EncodedDataset
             dataset per il training
         features: FeatureSet
             l'insieme di features degli alberi
         populationLen: int
             grandezza popolazione
         """
-        self.trainingSet = trainingSet
+        self.trainingSet = EncodedDataset.of(trainingSet, features)
         self.features = features
         self.populationLen = populationLen
 
     def __call__(self):
         population = []
-        with multiprocessing.Pool() as pool:  # usato per la multiprogrammazione
-            results = list()
-            # lancia un processo che esegue l'ID3 per ogni individuo da generare. Nota che a ognuno viene passato lo 0.7 del trainingset
-            for i in range(self.populationLen):
-                print("[firstGeneration.Id3Generation][ INFO ] inducing", i)
-                results.append(pool.apply_async(id3, [self.trainingSet.sample(frac=0.7), self.features]))
-            # recupera i risultati dei vari processi lanciati
-            for i, r in enumerate(results):
-                population.append(r.get())
-                print("[firstGeneration.Id3Generation][ INFO ] end induction of ", i)
+        # il trainingSet viene messo in memoria condivisa una sola volta, i processi del Pool vi si collegano all'avvio
+        segment = self.trainingSet.share()
+        try:
+            with multiprocessing.Pool(initializer=attach, initargs=([segment],)) as pool:  # usato per la multiprogrammazione
+                results = list()
+                # lancia un processo che esegue l'ID3 per ogni individuo da generare. Nota che a ognuno viene passato lo 0.7 del trainingset
+                for i in range(self.populationLen):
+                    print("[firstGeneration.Id3Generation][ INFO ] inducing", i)
+                    results.append(pool.apply_async(_sampleAndInduce, [self.trainingSet, self.features, 0.7]))
+                # recupera i risultati dei vari processi lanciati
+                for i, r in enumerate(results):
+                    population.append(r.get())
+                    print("[firstGeneration.Id3Generation][ INFO ] end induction of ", i)
+        finally:
+            self.trainingSet.release()
         return population
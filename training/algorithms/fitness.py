@@ -1,21 +1,80 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
 import pandas as pd
 
+from training.dataset import EncodedDataset
 from training.decisionTree3 import DecisionTree
 
 
-class AccuracyBasedFitness:
+class PredictionBasedFitness(ABC):
     """
-    Fitness dato dal rapporto (classificazioniCorrette / classificazioniTotali)
+    Base per i fitness calcolati a partire dalle classificazioni predette dall'albero sulle istanze di uno o piu' dataset (`datasets`).
+    Il calcolo e' diviso in due fasi: `predictions` classifica le istanze e `score` ne ricava il fitness.
+    Conoscendo le predizioni di un albero di riferimento (per esempio il genitore di un figlio generato dal crossover),
+    le predizioni di un albero derivato si ottengono ri-classificando solo le istanze che raggiungono i sotto alberi modificati
+
+    Methods
+    -------
+    predictions(elem: DecisionTree, reference: tuple[DecisionTree, list[numpy.ndarray]] = None) -> list[numpy.ndarray]:
+        classifica le istanze di ogni dataset
+    score(predictions: list[numpy.ndarray]) -> float:
+        calcola il fitness a partire dalle predizioni
     """
-    def __init__(self, dataset: pd.DataFrame):
-        self.dataset = dataset
+    datasets: list[EncodedDataset]
 
     def __call__(self, elem: DecisionTree):
-        c = 0  # contatore delle classificazioni corrette
-        for i, row in self.dataset.iterrows():
-            if elem.predict(row.to_dict()) == i:
-                c += 1
-        acc = c / self.dataset.index.size  # classificazioni corrette su istanze totali
+        return self.score(self.predictions(elem))
+
+    def predictions(self, elem: DecisionTree, reference: tuple[DecisionTree, list[np.ndarray]] = None) -> list[np.ndarray]:
+        """
+        Classifica le istanze di ogni dataset
+
+        Parameters
+        ----------
+        elem: DecisionTree
+            albero da valutare
+        reference: tuple[DecisionTree, list[numpy.ndarray]] = None
+            albero di riferimento e relative predizioni (come restituite da questo metodo). Se dato, vengono ri-classificate
+            solo le istanze che raggiungono le parti di `elem` diverse dal riferimento
+
+        Return
+        ------
+        list[numpy.ndarray]: per ogni dataset, codice della classificazione predetta per ogni istanza
+        """
+        if reference is None:
+            compiled = elem.compile()
+            return [compiled.predictLabels(dataset) for dataset in self.datasets]
+        referenceTree, referencePredictions = reference
+        return elem.updatePredictions(self.datasets, referenceTree, referencePredictions)
+
+    @abstractmethod
+    def score(self, predictions: list[np.ndarray]) -> float:
+        """
+        Calcola il fitness a partire dalle predizioni
+
+        Parameters
+        ----------
+        predictions: list[numpy.ndarray]
+            predizioni restituite da `predictions`
+
+        Return
+        ------
+        float: fitness dell'albero
+        """
+
+
+class AccuracyBasedFitness(PredictionBasedFitness):
+    """
+    Fitness dato dal rapporto (classificazioniCorrette / classificazioniTotali)
+    """
+    def __init__(self, dataset: pd.DataFrame | EncodedDataset):
+        self.dataset = EncodedDataset.of(dataset)
+        self.datasets = [self.dataset]
+
+    def score(self, predictions: list[np.ndarray]) -> float:
+        c = np.count_nonzero(predictions[0] == self.dataset.labels)  # numero di classificazioni corrette
+        acc = c / len(self.dataset)  # classificazioni corrette su istanze totali
         return acc
 
 
@@ -23,8 +82,8 @@ class AccuracyBasedFitnessPwm2(AccuracyBasedFitness):
     """
     Fitness dato dal rapporto (classificazioniCorrette / classificazioniTotali)^2
     """
-    def __call__(self, elem: DecisionTree):
-        acc = super().__call__(elem)
+    def score(self, predictions: list[np.ndarray]) -> float:
+        acc = super().score(predictions)
         return acc ** 2
 
 
@@ -32,28 +91,29 @@ class AccuracyBasedFitnessPwm3(AccuracyBasedFitness):
     """
     Fitness dato dal rapporto (classificazioniCorrette / classificazioniTotali)^3
     """
-    def __call__(self, elem: DecisionTree):
-        acc = super().__call__(elem)
+    def score(self, predictions: list[np.ndarray]) -> float:
+        acc = super().score(predictions)
         return acc ** 3
 
 
-class WeightedFormula:
+class WeightedFormula(PredictionBasedFitness):
     """
     Fitness dato dal rapporto [(alpha * accuratezzaSulTesting^2) + (beta * accuratezzaSulTraining^2)]
     """
     def __init__(self, alpha, beta, testing, training):
         self.alpha = alpha
         self.beta = beta
-        self.testing = testing
-        self.training = training
+        self.testing = AccuracyBasedFitnessPwm2(testing)
+        self.training = AccuracyBasedFitnessPwm2(training)
+        self.datasets = [self.testing.dataset, self.training.dataset]
 
-    def __call__(self, elem: DecisionTree):
-        fTesting = AccuracyBasedFitnessPwm2(self.testing)(elem)
-        fTraining = AccuracyBasedFitnessPwm2(self.training)(elem)
+    def score(self, predictions: list[np.ndarray]) -> float:
+        fTesting = self.testing.score(predictions[:1])
+        fTraining = self.training.score(predictions[1:])
         return (self.alpha * fTesting + self.beta * fTraining) / (self.alpha + self.beta)
 
 
-class RarityBasedFitness:
+class RarityBasedFitness(PredictionBasedFitness):
     """
         Il fitness e' basatto sulla WeightedFormula dove i pesi sono basati sulla rarita' delle label. Piu' una label
         e' rara, maggiore sara' il suo peso nella formula.
@@ -66,27 +126,16 @@ class RarityBasedFitness:
 
             Il risultato sara' poi normalizzato
     """
-    def __init__(self, dataset: pd.DataFrame):
-        self.dataset = dataset
-        perc = dataset.index.value_counts(normalize=True)
-        self.classifications = {}
-        for label in perc.index:
-            self.classifications[label] = 1 - perc[label]
-
-    def __call__(self, elem: DecisionTree):
-        rightClassifications = dict()
-        totalClassifications = dict()
-        for label in self.classifications.keys():
-            rightClassifications[label] = 0
-            totalClassifications[label] = 0
-
-        for i, row in self.dataset.iterrows():
-            if elem.predict(row.to_dict()) == i:
-                rightClassifications[i] += 1
-            totalClassifications[i] += 1
-        fitness = 0
-        normalize = 0
-        for label, multiplier in self.classifications.items():
-            fitness += multiplier*rightClassifications[label]/totalClassifications[label]
-            normalize += multiplier
+    def __init__(self, dataset: pd.DataFrame | EncodedDataset):
+        self.dataset = EncodedDataset.of(dataset)
+        self.datasets = [self.dataset]
+        self.totalClassifications = self.dataset.classCounts()  # numero di istanze per ogni label (indicizzato per codice della label)
+        self.multipliers = 1 - self.totalClassifications / len(self.dataset)
+
+    def score(self, predictions: list[np.ndarray]) -> float:
+        labels = self.dataset.labels
+        right = labels[predictions[0] == labels]  # label delle istanze classificate correttamente
+        rightClassifications = np.bincount(right, minlength=len(self.dataset.classes))
+        fitness = np.sum(self.multipliers * rightClassifications / self.totalClassifications)
+        normalize = np.sum(self.multipliers)
         return fitness/normalize
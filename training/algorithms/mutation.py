@@ -17,6 +17,7 @@ class ChangeTestMutation:
         node = decisionTree.nodes[nodeId]
         if node.isLeaf() or not decisionTree.features[node.feature].isNumerical():
             return None
+        node = decisionTree.writable(nodeId)  # il nodo potrebbe essere condiviso con altri alberi (vedi DecisionTree.fork)
         node.threshold += decisionTree.features[node.feature].getRand()
         pruning(decisionTree, nodeId)
 
@@ -35,6 +36,7 @@ class ChangeAttributeMutation:
                 not decisionTree.features[newFeature].isNumerical():
             return
         # domainFeature = dataset[newFeature].unique()
+        node = decisionTree.writable(nodeId)
         node.feature = newFeature
         node.threshold = decisionTree.features[node.feature].getRand()
         pruning(decisionTree, nodeId)
@@ -51,7 +53,7 @@ class NodeSwapsMutation:
             nodeId = random.choice(list(decisionTree.nodes.keys()))
             node = decisionTree.nodes[nodeId]
             if not node.isLeaf():
-                nodes.append((nodeId, node))
+                nodes.append((nodeId, decisionTree.writable(nodeId)))
 
         nodeIdA, nodeA = nodes.pop()
         nodeIdB, nodeB = nodes.pop()
@@ -1,4 +1,3 @@
-import copy
 from math import inf
 
 from training.decisionTree3 import DecisionTree
@@ -11,21 +10,21 @@ def pruning(decisionTree: DecisionTree, nodeId: int) -> None:
     della sezione del primo esperimento
     """
 
-    """        
-    Un dominio e' rappresentato come una terna T tale che 
-    - T[0] e' il minimo valore del dominio (dominio maggiore o uguale di T[0]), 
-    - T[1] e' il solo valore del dominio (dominio = T[1])
-    - T[2] e' il massimo valore del dominio (dominio minore di T[2])
+    """
+    Il dominio di una feature e' rappresentato da tre limiti:
+    - low[f] e' il minimo valore del dominio (dominio maggiore o uguale di low[f]),
+    - eq[f] e' il solo valore del dominio (dominio = eq[f])
+    - high[f] e' il massimo valore del dominio (dominio minore di high[f])
 
-    dominio = [t[0],t[2]) or t[1]
+    dominio = [low[f], high[f]) or eq[f]
 
-    None rappresenta un "non limite"
+    Vengono memorizzati solo i limiti delle features vincolate dal cammino: una feature assente e' un "non limite"
+    (-inf, None e inf rispettivamente), cosi' il costo non dipende dal numero di features
     """
 
-    domain = dict()
-    # inizializzazione del dominio di ogni features
-    for feature in decisionTree.features:
-        domain[feature] = [-inf, None, inf]
+    low: dict[str, any] = dict()
+    eq: dict[str, any] = dict()
+    high: dict[str, any] = dict()
 
     # Calcolo dei domini da nodeId risalendo fino alla radice
     currentNode = decisionTree.nodes[nodeId]
@@ -36,9 +35,9 @@ def pruning(decisionTree: DecisionTree, nodeId: int) -> None:
         # Limite superiore feature
         if currentLabel is True:
             # in questo caso, ci troviamo in un nodo dove, il parent e' della forma 'feature < threshold' e il ramo che unisce il nodo al padre ha label True
-            if domain[currentNode.feature][2] == inf:
-                domain[currentNode.feature][2] = currentNode.threshold
-            elif currentNode.threshold < domain[currentNode.feature][2]: #TODO: dovrebe essere <= no <
+            if high.get(currentNode.feature, inf) == inf:
+                high[currentNode.feature] = currentNode.threshold
+            elif currentNode.threshold < high[currentNode.feature]: #TODO: dovrebe essere <= no <
                 # se il dominio non e' inf, vuol dire che abbiamo gia' trovato un nodo che faceva un taglio su quella feature, tuttavia
                 # se il nodo attuale dovesse avere un valore di threshold minore di quello precedentemente incontrato, allora abbiamo un inconsistenza nell'albero
                 # questo elif non dovrebbe mai essere vero. In caso contrario, ci sono degli errori nel codice
@@ -48,30 +47,35 @@ def pruning(decisionTree: DecisionTree, nodeId: int) -> None:
         # limite inferiore feature
         elif currentLabel is False:
             # analogo all'if sopra
-            if domain[currentNode.feature][0] == -inf:
-                domain[currentNode.feature][0] = currentNode.threshold
-            elif currentNode.threshold >= domain[currentNode.feature][0]:
+            if low.get(currentNode.feature, -inf) == -inf:
+                low[currentNode.feature] = currentNode.threshold
+            elif currentNode.threshold >= low[currentNode.feature]:
                 print("[ Error ] Trovata inconsistenza nel partizionamento della feature ", currentNode.feature)
                 decisionTree.printToFile("local/broken")
 
         # Uguaglianza
         else:
-            if domain[currentNode.feature][1] is not None:
+            if eq.get(currentNode.feature) is not None:
                 # anche questo if e' per trovare inconsistenze nell'albero, pertanto non dovrebbe mai essere true
                 print("[ Error ] Trovata inconsistenza nel partizionamento della feature ", currentNode.feature)
                 decisionTree.printToFile("local/broken")
-            domain[currentNode.feature][1] = currentLabel
+            eq[currentNode.feature] = currentLabel
 
-    # ottenuti i domini, passiamo alla rimozione dei nodi inconsistenti nel nuovo sottoalbero inserito
-    stack = [(nodeId, copy.deepcopy(domain))]
+    # ottenuti i domini, passiamo alla rimozione dei nodi inconsistenti nel nuovo sottoalbero inserito.
+    # Solo la radice del sottoalbero restringe il dominio dei propri figli: ogni elemento dello stack porta con se' l'eventuale
+    # restrizione del ramo da cui proviene, come terna (feature, limite, valore) con limite 0 = low, 1 = eq, 2 = high
+    stack = [(nodeId, None)]
     while len(stack) > 0:
-        nid, cdomain = stack.pop()
+        nid, restriction = stack.pop()
         node = decisionTree.nodes.get(nid)
         if node.isLeaf():
             continue
-        nodeFeatureDomain = cdomain[node.feature]
+        feature = node.feature
+        nodeFeatureDomain = [low.get(feature, -inf), eq.get(feature), high.get(feature, inf)]
+        if restriction is not None and restriction[0] == feature:
+            nodeFeatureDomain[restriction[1]] = restriction[2]
         replacedBy = None
-        if not decisionTree.features[node.feature].isNumerical():
+        if not decisionTree.features[feature].isNumerical():
             # Se la feature non e' ordinata e il dominio[1] ha un qualche valore, allora il nodo attuale e' inconsistente
             if nodeFeatureDomain[1] is not None:
                 # rimuove il nodo e lo rimpiazza con il figlio sul ramo con label corrispondente al dominio individuato
@@ -87,16 +91,15 @@ def pruning(decisionTree: DecisionTree, nodeId: int) -> None:
         # i nodi figli, altrimenti inseriamo nello stack il nodo che ha rimpiazzato quello corrente senza alterare i domini
         if replacedBy is None:
             for label, cid in node.children.items():
-                nextDomain = cdomain
+                nextRestriction = restriction
                 if nodeId == nid:
-                    nextDomain = copy.deepcopy(cdomain)
                     match label:
                         case True:
-                            nextDomain[node.feature][2] = node.threshold
+                            nextRestriction = (feature, 2, node.threshold)
                         case False:
-                            nextDomain[node.feature][0] = node.threshold
+                            nextRestriction = (feature, 0, node.threshold)
                         case _:
-                            nextDomain[node.feature][1] = label
-                stack.append((cid, nextDomain))
+                            nextRestriction = (feature, 1, label)
+                stack.append((cid, nextRestriction))
         else:
-            stack.append((replacedBy, cdomain))
+            stack.append((replacedBy, restriction))
@@ -1,20 +1,104 @@
+from abc import ABC, abstractmethod
+
 import numpy as np
 
 from training.decisionTree3 import DecisionTree
 
 
-class WheelSelection:
+class IndexSelection(ABC):
+    """
+    Base per le selezioni che estraggono tutti i genitori di una generazione in una sola volta.
+    La selezione e' divisa in due fasi: `table` prepara, una sola volta per generazione, le tabelle di campionamento
+    a partire dal fitness della popolazione e `draw` estrae da queste tabelle gli indici dei genitori di tutte le draws.
+    Chiamata come una selezione classica (population, fitness) restituisce i genitori di una sola draw
+
+    Methods
+    -------
+    table(fitness: list[float]) -> any:
+        prepara le tabelle di campionamento della generazione
+    draw(table: any, draws: int) -> numpy.ndarray:
+        estrae gli indici dei genitori di draws iterazioni del crossover
+    select(fitness: list[float], draws: int) -> numpy.ndarray:
+        table e draw in una sola chiamata
+    """
+    rng: np.random.Generator
+
+    def __call__(self, population: list[DecisionTree], fitness: list[float]) -> list[DecisionTree]:
+        return [population[i] for i in self.select(fitness, 1)[0]]
+
+    @abstractmethod
+    def table(self, fitness: list[float]) -> any:
+        """
+        Prepara le tabelle di campionamento della generazione
+
+        Parameters
+        ----------
+        fitness: list[float]
+            fitness degli individui della popolazione
+
+        Return
+        ------
+        any: tabelle da passare a `draw`
+        """
+
+    @abstractmethod
+    def draw(self, table: any, draws: int) -> np.ndarray:
+        """
+        Estrae i genitori di draws iterazioni del crossover
+
+        Parameters
+        ----------
+        table: any
+            tabelle restituite da `table`
+        draws: int
+            numero di iterazioni del crossover
+
+        Return
+        ------
+        numpy.ndarray: matrice di draws righe, ogni riga contiene gli indici (nella popolazione) dei genitori di una iterazione
+        """
+
+    def select(self, fitness: list[float], draws: int) -> np.ndarray:
+        """
+        Estrae gli indici dei genitori di draws iterazioni del crossover (vedi `table` e `draw`)
+        """
+        return self.draw(self.table(fitness), draws)
+
+
+class WheelSelection(IndexSelection):
     """
-    Wheel Selection. Le probabilita' di un individuo di essere selezionato, sono pari al proprioFitness / totalFitness
+    Wheel Selection. Le probabilita' di un individuo di essere selezionato, sono pari al proprioFitness / totalFitness.
+    I due genitori di ogni draw sono distinti (se la popolazione ha almeno due individui)
     """
-    @staticmethod
-    def __call__(population: list[DecisionTree], fitness: list[float]) -> list[DecisionTree, DecisionTree]:
-        sumFitness = sum(fitness)
-        s = np.random.default_rng().choice(population, 2, replace=len(population) < 2, p=[x / sumFitness for x in fitness])
-        return s
 
+    def __init__(self):
+        self.rng = np.random.default_rng()
+
+    def table(self, fitness: list[float]) -> np.ndarray:
+        # somme prefisse del fitness: l'individuo i occupa l'intervallo [cumulative[i-1], cumulative[i]) della ruota
+        fitness = np.asarray(fitness, dtype=float)
+        if len(fitness) == 0 or fitness.min() < 0 or fitness.sum() <= 0:
+            raise ValueError("fitness values must be non-negative with a positive sum")
+        if len(fitness) >= 2 and np.count_nonzero(fitness) < 2:
+            raise ValueError("at least two individuals with a positive fitness are needed")
+        return np.cumsum(fitness)
+
+    def draw(self, table: np.ndarray, draws: int) -> np.ndarray:
+        first = self._spin(table, draws)
+        second = self._spin(table, draws)
+        if len(table) >= 2:
+            # estrazione senza rimpiazzo: il secondo genitore viene ri-estratto finche' coincide con il primo
+            same = np.flatnonzero(first == second)
+            while len(same) > 0:
+                second[same] = self._spin(table, len(same))
+                same = same[first[same] == second[same]]
+        return np.stack((first, second), axis=1)
 
-class TournamentSelection:
+    def _spin(self, cumulative: np.ndarray, size: int) -> np.ndarray:
+        return np.searchsorted(cumulative, self.rng.random(size) * cumulative[-1], side="right")
+
+
+class TournamentSelection(IndexSelection):
     """
     Tournament selection
     """
@@ -32,20 +116,95 @@ class TournamentSelection:
         self.tournamentSize = tournamentSize
         self.winnersSize = winnersSize
         self.prob = prob
+        self.rng = np.random.default_rng()
+
+    def table(self, fitness: list[float]) -> np.ndarray:
+        # ordine degli individui per fitness decrescente (a parita' di fitness l'ordine e' casuale): un torneo viene svolto
+        # sulle posizioni in questo ordine, quindi non serve ordinare i partecipanti di ogni torneo
+        fitness = np.asarray(fitness, dtype=float)
+        return np.lexsort((self.rng.random(len(fitness)), -fitness))
+
+    def draw(self, table: np.ndarray, draws: int) -> np.ndarray:
+        n = len(table)
+        tournaments = draws * self.winnersSize
+        if self.tournamentSize > n:
+            participants = self.rng.integers(0, n, (tournaments, self.tournamentSize))
+        else:
+            # tournamentSize posizioni distinte per ogni torneo: quelle con le chiavi casuali piu' piccole
+            participants = self.rng.random((tournaments, n)).argpartition(self.tournamentSize - 1, axis=1)[:, :self.tournamentSize]
+        participants.sort(axis=1)  # partecipanti dal migliore al peggiore
+        # i partecipanti vengono scorsi ciclicamente dal migliore, ognuno vince con probabilita' prob:
+        # il vincitore e' il partecipante in posizione (tentativi - 1) % tournamentSize
+        winners = (self.rng.geometric(self.prob, tournaments) - 1) % self.tournamentSize
+        return table[participants[np.arange(tournaments), winners]].reshape(draws, self.winnersSize)
+
+
+class StochasticUniversalSampling(IndexSelection):
+    """
+    Stochastic universal sampling. Come nella Wheel Selection ogni individuo occupa sulla ruota uno spazio proporzionale
+    al proprio fitness, ma tutti i genitori di una generazione vengono scelti con un solo giro: la ruota viene letta
+    in 2 * draws punti equidistanti a partire da un'unica posizione casuale. Il numero di volte in cui un individuo viene scelto
+    differisce dal valore atteso di meno di uno, anche quando i valori di fitness sono molto vicini tra loro.
+    Le coppie vengono formate mescolando i genitori scelti; come nella Wheel Selection i due genitori di ogni draw sono distinti,
+    tranne quando un individuo occupa piu' di meta' dei punti e non e' possibile formare abbastanza coppie distinte
+    """
+
+    def __init__(self):
+        self.rng = np.random.default_rng()
+
+    def table(self, fitness: list[float]) -> np.ndarray:
+        fitness = np.asarray(fitness, dtype=float)
+        if len(fitness) == 0 or fitness.min() < 0 or fitness.sum() <= 0:
+            raise ValueError("fitness values must be non-negative with a positive sum")
+        return np.cumsum(fitness)
+
+    def draw(self, table: np.ndarray, draws: int) -> np.ndarray:
+        size = 2 * draws
+        # punti equidistanti sulla ruota: l'individuo scelto da ogni punto si trova con una ricerca binaria nelle somme prefisse
+        pointers = (self.rng.random() + np.arange(size)) * (table[-1] / size)
+        parents = np.searchsorted(table, pointers, side="right")
+        self.rng.shuffle(parents)
+        pairs = parents.reshape(draws, 2)
+        # una coppia con due volte lo stesso individuo scambia il secondo genitore con quello di un'altra coppia che non contiene
+        # l'individuo: il numero di volte in cui ogni individuo viene scelto non cambia
+        for i in np.flatnonzero(pairs[:, 0] == pairs[:, 1]):
+            individual = pairs[i, 0]
+            if pairs[i, 1] != individual:
+                continue  # gia' corretta da uno scambio precedente
+            candidates = np.flatnonzero((pairs[:, 0] != individual) & (pairs[:, 1] != individual))
+            if len(candidates) > 0:
+                j = self.rng.choice(candidates)
+                pairs[i, 1], pairs[j, 1] = pairs[j, 1], individual
+        return pairs
+
+
+class RankSelection(StochasticUniversalSampling):
+    """
+    Rank selection lineare. La probabilita' di un individuo di essere selezionato dipende solo dalla sua posizione
+    nella popolazione ordinata per fitness: va da (2 - pressure) / n per il peggiore a pressure / n per il migliore.
+    La pressione selettiva non dipende quindi dalla distanza tra i valori di fitness. I genitori vengono scelti come
+    nello Stochastic universal sampling
+    """
+
+    def __init__(self, pressure: float = 1.5):
+        """
+        Parameters
+        ----------
+        pressure: float = 1.5
+            valore tra [1,2]. E' il numero atteso di volte (per individuo della popolazione) in cui il migliore viene selezionato;
+            con 1 tutti gli individui hanno la stessa probabilita'
+        """
+        super().__init__()
+        if not 1 <= pressure <= 2:
+            raise ValueError("pressure must be in [1, 2]")
+        self.pressure = pressure
 
-    def __call__(self, population: list[DecisionTree], fitness: list[float]) -> list[DecisionTree, DecisionTree]:
-        winners = []
-        zipped = list(zip(population, fitness))
-        r = np.random.default_rng()
-        for _ in range(self.winnersSize):
-            currentTournamentPopulation = list(r.choice(zipped, self.tournamentSize, replace=self.tournamentSize > len(zipped)))  # seleziona randomicamente tournamentSize individui senza rimpiazzo
-            currentTournamentPopulation.sort(key=lambda el : el[1], reverse=True)             # ordina gli individui selezionati in base al fitness decrescente
-            i = 0
-            while True:
-                el = currentTournamentPopulation[i % self.tournamentSize]
-                if r.random() < self.prob:
-                    winner = el
-                    break
-                i += 1
-            winners.append(winner[0])
-        return winners
+    def table(self, fitness: list[float]) -> np.ndarray:
+        fitness = np.asarray(fitness, dtype=float)
+        n = len(fitness)
+        if n == 0:
+            raise ValueError("the population is empty")
+        ranks = np.empty(n)
+        ranks[np.lexsort((self.rng.random(n), fitness))] = np.arange(n)  # 0 = peggiore, a parita' di fitness l'ordine e' casuale
+        weights = (2 - self.pressure) + 2 * (self.pressure - 1) * ranks / max(1, n - 1)
+        return np.cumsum(weights)
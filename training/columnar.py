@@ -0,0 +1,170 @@
+"""
+Formato binario a colonne per i dataset, alternativo al csv: un file contiene un header (json) con lo schema del dataset,
+seguito dagli array delle colonne, allineati a 8 byte e letti senza conversioni.
+- le colonne numeriche sono salvate con il loro tipo numerico
+- le colonne non numeriche sono salvate come codici interi, il valore originale e' `vocabulary[codice]`
+- le classificazioni (l'indice del DataFrame) sono salvate come codici interi, il valore originale e' `classes[codice]`
+Caricare un dataset non richiede di interpretare il testo ne' di dedurre i tipi delle colonne, che restano quelli dello schema.
+Lo schema contiene anche la firma del FeatureSet usato per il salvataggio (nomi delle features e quali sono numeriche).
+Il file a colonne e' solo una copia: il csv resta la fonte dei dati (il Logger scrive solo il csv) e la copia va ricreata
+quando il csv e' piu' recente o le features sono cambiate (vedi `isUpToDate`)
+"""
+from __future__ import annotations
+import json
+import os
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from training.dataset import _codeType, _isNumerical
+
+if TYPE_CHECKING:
+    from training.decisionTree3 import FeatureSet
+
+
+_MAGIC = b"DGCOLS01"
+_ALIGN = 8
+
+
+def _toJson(values: list) -> list:
+    """
+    Converte i valori di un vocabolario in tipi serializzabili in json
+    """
+    return [v.item() if isinstance(v, np.generic) else v for v in values]
+
+
+def _signature(features: FeatureSet | None) -> list | None:
+    """
+    Firma di un FeatureSet: nome di ogni feature, nell'ordine delle colonne, e se e' numerica
+    """
+    if features is None:
+        return None
+    return [[name, bool(_isNumerical(features, name, None))] for name in features.columns()]
+
+
+def save(frame: pd.DataFrame, path: str, features: FeatureSet = None) -> None:
+    """
+    Salva un dataset nel formato a colonne. Il file viene scritto a parte e poi sostituito a quello esistente,
+    cosi' un processo che lo legge non trova mai un file scritto a meta'
+
+    Parameters
+    ----------
+    frame: pandas.DataFrame
+        dataset da salvare, con le classificazioni come indice
+    path: str
+        file in cui salvare il dataset
+    features: FeatureSet = None
+        se presente, stabilisce quali colonne sono numeriche; altrimenti viene usato il tipo delle colonne del DataFrame
+    """
+    schema = {"rows": len(frame), "features": _signature(features), "columns": list(), "arrays": list()}
+    arrays = list()
+    for name in frame.columns:
+        column = frame[name]
+        if _isNumerical(features, name, column):
+            values = column.to_numpy() if pd.api.types.is_numeric_dtype(column) else column.to_numpy(dtype=float)
+            schema["columns"].append({"name": name, "numerical": True})
+        else:
+            codes, uniques = pd.factorize(column)
+            values = codes.astype(_codeType(len(uniques)))
+            schema["columns"].append({"name": name, "numerical": False, "vocabulary": _toJson(uniques.tolist())})
+        arrays.append(values)
+    labels, classes = pd.factorize(frame.index)
+    schema["classes"] = _toJson(classes.tolist())
+    arrays.append(labels.astype(_codeType(len(classes))))
+
+    offset = 0
+    for a in arrays:
+        offset += -offset % _ALIGN
+        schema["arrays"].append([offset, a.dtype.str])
+        offset += a.nbytes
+    header = json.dumps(schema).encode()
+    start = len(_MAGIC) + 8 + len(header)
+    start += -start % _ALIGN  # inizio dell'area degli array
+
+    tmpPath = f"{path}.tmp"
+    with open(tmpPath, "wb") as file:
+        file.write(_MAGIC)
+        file.write(len(header).to_bytes(8, "little"))
+        file.write(header)
+        for a, (offset, _) in zip(arrays, schema["arrays"]):
+            file.seek(start + offset)
+            file.write(np.ascontiguousarray(a).tobytes())
+    os.replace(tmpPath, path)
+
+
+def _readSchema(file) -> tuple[dict, int]:
+    """
+    Legge lo schema di un dataset a colonne da un file aperto in lettura binaria
+
+    Return
+    ------
+    tuple[dict, int]: lo schema e la posizione nel file dell'area degli array
+    """
+    if file.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError(f"{file.name} is not a columnar dataset")
+    size = int.from_bytes(file.read(8), "little")
+    schema = json.loads(file.read(size))
+    start = len(_MAGIC) + 8 + size
+    return schema, start + -start % _ALIGN
+
+
+def load(path: str) -> pd.DataFrame:
+    """
+    Carica un dataset salvato con `save`. Il file viene letto con una sola lettura e le colonne vengono costruite dagli array
+    dello schema (il DataFrame restituito ne contiene una copia);
+    le colonne non numeriche diventano colonne `category` con il vocabolario dello schema.
+    Gli operatori del GA codificano il dataset con EncodedDataset, che produce gli stessi codici per una colonna `category`
+    e per la colonna letta dal csv
+
+    Parameters
+    ----------
+    path: str
+        file del dataset
+
+    Return
+    ------
+    pandas.DataFrame: il dataset, con le classificazioni come indice
+    """
+    with open(path, "rb") as file:
+        schema, start = _readSchema(file)
+        file.seek(start)
+        data = file.read()
+    rows = schema["rows"]
+    views = [np.frombuffer(data, np.dtype(dtype), count=rows, offset=offset) for offset, dtype in schema["arrays"]]
+
+    columns = dict()
+    for column, values in zip(schema["columns"], views):
+        if column["numerical"]:
+            columns[column["name"]] = values
+        else:
+            columns[column["name"]] = pd.Categorical.from_codes(values, categories=column["vocabulary"])
+    index = pd.Index(np.array(schema["classes"], dtype=object)[views[-1]])
+    return pd.DataFrame(columns, index=index)
+
+
+def isUpToDate(path: str, source: str, features: FeatureSet = None) -> bool:
+    """
+    True se il dataset a colonne esiste, non e' piu' vecchio del file da cui e' stato creato
+    e (se `features` e' presente) e' stato salvato con le stesse features
+
+    Parameters
+    ----------
+    path: str
+        file del dataset a colonne
+    source: str
+        file (per esempio il csv) da cui e' stato creato
+    features: FeatureSet = None
+        se presente, il dataset deve essere stato salvato con un FeatureSet con le stesse features, nello stesso ordine
+        e con gli stessi tipi (numeriche o no)
+    """
+    if not os.path.isfile(path) or (os.path.isfile(source) and os.path.getmtime(path) < os.path.getmtime(source)):
+        return False
+    if features is None:
+        return True
+    try:
+        with open(path, "rb") as file:
+            schema, _ = _readSchema(file)
+    except ValueError:
+        return False
+    return schema.get("features") == _signature(features)
@@ -0,0 +1,503 @@
+from __future__ import annotations
+import copy
+import numbers
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from training.decisionTree3 import FeatureSet
+
+
+# Segmenti di memoria condivisa gia' collegati nel processo corrente, key = nome del segmento
+_segments: dict[str, SharedMemory] = dict()
+
+# DataFrame gia' codificati da EncodedDataset.of, key = (id del DataFrame, id del FeatureSet):
+# value = (riferimento debole al DataFrame, FeatureSet, dataset codificato). La voce viene rimossa quando il DataFrame viene eliminato
+_encoded: dict[tuple[int, int], tuple[weakref.ref, FeatureSet | None, EncodedDataset]] = dict()
+
+
+def attach(segments: list[str]) -> None:
+    """
+    Collega il processo corrente ai segmenti di memoria condivisa indicati.
+    Pensata come `initializer` di un multiprocessing.Pool: i dataset condivisi ricevuti dai task usano il segmento gia' collegato
+
+    Parameters
+    ----------
+    segments: list[str]
+        nomi dei segmenti (vedi EncodedDataset.share)
+    """
+    for name in segments:
+        if name not in _segments:
+            _segments[name] = SharedMemory(name=name)
+
+
+def findDatasets(*objects: any) -> list[EncodedDataset]:
+    """
+    Restituisce tutti gli EncodedDataset raggiungibili dagli oggetti dati, visitandone gli attributi e i contenitori (list, tuple, dict)
+
+    Parameters
+    ----------
+    objects: any
+        oggetti da cui iniziare la ricerca (per esempio funzioni di fitness e crossover)
+
+    Return
+    ------
+    list[EncodedDataset]: dataset trovati, senza ripetizioni
+    """
+    found = dict()
+    visited = set()
+    stack = list(objects)
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in visited:
+            continue
+        visited.add(id(obj))
+        if isinstance(obj, EncodedDataset):
+            found[id(obj)] = obj
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+            stack.extend(vars(obj).values())
+    return list(found.values())
+
+
+def _isNumerical(features: FeatureSet | None, name: str, column: pd.Series) -> bool:
+    """
+    True se la colonna e' numerica secondo il FeatureSet (sia per le features create con `add` che con `addNew`),
+    oppure secondo il tipo della colonna se la feature non e' nel FeatureSet
+    """
+    if features is not None and name in features:
+        feature = features[name]
+        return feature if isinstance(feature, bool) else feature.isNumerical()
+    return pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column)
+
+
+def _codeType(size: int) -> type:
+    """
+    Restituisce il tipo intero (con segno) piu' piccolo in grado di contenere i codici di un vocabolario di `size` elementi.
+    Il segno serve per il codice -1, usato per i valori non presenti nel vocabolario (vedi EncodedDataset.encode)
+    """
+    for t in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(t).max:
+            return t
+    return np.int64
+
+
+class EncodedDataset:
+    """
+    Dataset pre-elaborato: ogni colonna viene codificata una sola volta e riutilizzata da id3, fitness e crossover.
+    - le colonne numeriche sono array numerici
+    - le colonne non numeriche sono array di codici interi, il valore originale e' `vocabulary[colonna][codice]`
+    - le classificazioni (l'indice del DataFrame) sono array di codici interi, il valore originale e' `classes[codice]`
+
+    Methods
+    -------
+    of(dataset: pandas.DataFrame | EncodedDataset, features: FeatureSet = None) -> EncodedDataset
+        Codifica un DataFrame, oppure restituisce il dataset stesso se e' gia' codificato
+    isNumerical(name: str) -> bool
+        True se la colonna e' numerica
+    encode(name: str, value: any) -> any
+        Converte un valore della colonna nella sua codifica
+    encodeLabel(label: any) -> int
+        Restituisce il codice di una classificazione
+    lessThan(name: str, threshold: any, rows: numpy.ndarray = None) -> numpy.ndarray
+        Maschera delle righe con valore della colonna < threshold
+    classCounts(rows: numpy.ndarray = None) -> numpy.ndarray
+        Numero di ricorrenze di ogni classificazione
+    row(i: int) -> dict[str, any]
+        Restituisce la riga i-esima come dizionario "feature: value"
+    sample(frac: float) -> numpy.ndarray
+        Indici di un campione casuale di righe
+    take(rows: numpy.ndarray) -> EncodedDataset
+        Restituisce il sotto-dataset con le sole righe indicate
+    share() -> str
+        Sposta gli array del dataset in memoria condivisa
+    release() -> None
+        Riporta gli array in memoria privata e libera la memoria condivisa
+    """
+
+    def __init__(self, frame: pd.DataFrame, features: FeatureSet = None):
+        """
+        Parameters
+        ----------
+        frame: pandas.DataFrame
+            dataset da codificare, con le classificazioni come indice
+        features: FeatureSet = None
+            se presente, stabilisce quali colonne sono numeriche; altrimenti viene usato il tipo delle colonne del DataFrame.
+            Le colonne non numeriche e l'indice non possono contenere valori mancanti (NaN), che non avrebbero un codice nel vocabolario:
+            in tal caso viene sollevato un ValueError
+        """
+        self.columns: list[str] = list(frame.columns)
+        self.values: dict[str, np.ndarray] = dict()     # key = nome colonna, value = valori (numerici) o codici della colonna
+        self.vocabulary: dict[str, list] = dict()       # key = nome colonna non numerica, value = valori distinti della colonna
+        self._codes: dict[str, dict[any, int]] = dict()  # key = nome colonna non numerica, value = dizionario {valore: codice}
+        for name in self.columns:
+            column = frame[name]
+            if _isNumerical(features, name, column):
+                self.values[name] = column.to_numpy() if pd.api.types.is_numeric_dtype(column) else column.to_numpy(dtype=float)
+            else:
+                codes, uniques = pd.factorize(column)
+                if np.any(codes < 0):
+                    raise ValueError(f"column '{name}' contains missing values")
+                self.vocabulary[name] = uniques.tolist()
+                self._codes[name] = {v: c for c, v in enumerate(self.vocabulary[name])}
+                self.values[name] = codes.astype(_codeType(len(uniques)))
+        labels, classes = pd.factorize(frame.index)
+        if np.any(labels < 0):
+            raise ValueError("the index (classifications) contains missing values")
+        self.classes: list = classes.tolist()
+        self._classCodes: dict[any, int] = {v: c for c, v in enumerate(self.classes)}
+        self.labels: np.ndarray = labels.astype(_codeType(len(classes)))
+        self._segment: str | None = None  # nome del segmento di memoria condivisa che contiene gli array, None se in memoria privata
+        self._shareCount: int = 0         # numero di chiamate a `share` non ancora seguite da `release` (solo nel processo che ha creato il segmento)
+
+    @classmethod
+    def of(cls, dataset: pd.DataFrame | EncodedDataset, features: FeatureSet = None) -> EncodedDataset:
+        """
+        Codifica un DataFrame, oppure restituisce il dataset stesso se e' gia' codificato.
+        Un DataFrame viene codificato una sola volta per FeatureSet: le chiamate successive con lo stesso DataFrame
+        restituiscono lo stesso EncodedDataset, cosi' gli operatori del GA che ricevono lo stesso DataFrame condividono
+        un'unica codifica (e un unico segmento di memoria condivisa). Il DataFrame non deve essere modificato dopo la codifica
+
+        Parameters
+        ----------
+        dataset: pandas.DataFrame | EncodedDataset
+            dataset da codificare
+        features: FeatureSet = None
+            vedi il costruttore
+
+        Return
+        ------
+        EncodedDataset: dataset codificato
+        """
+        if isinstance(dataset, EncodedDataset):
+            return dataset
+        key = (id(dataset), id(features))
+        entry = _encoded.get(key)
+        if entry is not None and entry[0]() is dataset and entry[1] is features:
+            return entry[2]
+        encoded = EncodedDataset(dataset, features)
+        _encoded[key] = (weakref.ref(dataset, lambda _: _encoded.pop(key, None)), features, encoded)
+        return encoded
+
+    def __len__(self):
+        return self.labels.size
+
+    def isNumerical(self, name: str) -> bool:
+        """
+        True se la colonna e' numerica, False se e' codificata con un vocabolario
+        """
+        return name not in self.vocabulary
+
+    def encode(self, name: str, value: any) -> any:
+        """
+        Converte un valore della colonna nella sua codifica, confrontabile direttamente con `values[name]`
+
+        Parameters
+        ----------
+        name: str
+            nome della colonna
+        value: any
+            valore da codificare
+
+        Return
+        ------
+        any: il codice del valore (-1 se non presente nel vocabolario) per le colonne non numeriche,
+        il valore stesso (nan se non e' un numero) per le colonne numeriche
+        """
+        if self.isNumerical(name):
+            return value if isinstance(value, numbers.Number) else np.nan
+        return self._codes[name].get(value, -1)
+
+    def encodeLabel(self, label: any) -> int:
+        """
+        Restituisce il codice di una classificazione, -1 se la classificazione non e' presente nel dataset
+        """
+        return self._classCodes.get(label, -1)
+
+    def lessThan(self, name: str, threshold: any, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Restituisce la maschera delle righe in cui il valore della colonna e' minore del threshold
+
+        Parameters
+        ----------
+        name: str
+            nome della colonna
+        threshold: any
+            valore di threshold
+        rows: numpy.ndarray = None
+            indici delle righe da considerare. Se None, vengono considerate tutte le righe
+
+        Return
+        ------
+        numpy.ndarray: array di booleani, uno per ogni riga considerata
+        """
+        values = self.values[name] if rows is None else self.values[name][rows]
+        if self.isNumerical(name):
+            return values < threshold
+        # il confronto viene fatto una sola volta per ogni valore del vocabolario; l'ultimo elemento e' per il codice -1
+        table = np.array([v < threshold for v in self.vocabulary[name]] + [False], dtype=bool)
+        return table[values]
+
+    def classCounts(self, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Restituisce il numero di ricorrenze di ogni classificazione (l'elemento i-esimo si riferisce a `classes[i]`)
+
+        Parameters
+        ----------
+        rows: numpy.ndarray = None
+            indici delle righe da considerare. Se None, vengono considerate tutte le righe
+        """
+        labels = self.labels if rows is None else self.labels[rows]
+        return np.bincount(labels, minlength=len(self.classes))
+
+    def row(self, i: int) -> dict[str, any]:
+        """
+        Restituisce la riga i-esima decodificata, come dizionario "feature: value"
+        """
+        values = dict()
+        for name in self.columns:
+            v = self.values[name][i]
+            if self.isNumerical(name):
+                values[name] = v.item()
+            else:
+                values[name] = self.vocabulary[name][v] if v >= 0 else None
+        return values
+
+    def sample(self, frac: float) -> np.ndarray:
+        """
+        Restituisce gli indici di un campione casuale (senza rimpiazzo) di righe
+
+        Parameters
+        ----------
+        frac: float
+            frazione delle righe da campionare
+        """
+        return np.random.default_rng().choice(len(self), size=round(frac * len(self)), replace=False)
+
+    def take(self, rows: np.ndarray) -> EncodedDataset:
+        """
+        Restituisce il sotto-dataset con le sole righe indicate. I vocabolari sono condivisi con il dataset originale
+
+        Parameters
+        ----------
+        rows: numpy.ndarray
+            indici o maschera booleana delle righe
+        """
+        subset = copy.copy(self)
+        subset.values = {name: values[rows] for name, values in self.values.items()}
+        subset.labels = self.labels[rows]
+        subset._segment = None  # il sotto-dataset e' sempre in memoria privata
+        return subset
+
+    def share(self) -> str:
+        """
+        Sposta gli array del dataset (valori delle colonne e classificazioni) in un unico segmento di memoria condivisa.
+        Da questo momento, quando il dataset viene serializzato (per esempio per essere inviato a un processo di un Pool)
+        vengono trasmessi solo il nome del segmento e la sua disposizione: il processo che lo riceve si collega al segmento
+        invece di ricevere una copia dei dati.
+        Ogni chiamata deve essere seguita da una chiamata a `release`
+
+        Return
+        ------
+        str: nome del segmento di memoria condivisa (vedi `attach`)
+        """
+        self._shareCount += 1
+        if self._segment is not None:
+            return self._segment
+        arrays = [self.labels] + [self.values[name] for name in self.columns]
+        offsets = list()
+        size = 0
+        for a in arrays:
+            size += -size % 8  # allineamento a 8 byte
+            offsets.append(size)
+            size += a.nbytes
+        shm = SharedMemory(create=True, size=max(size, 1))
+        _segments[shm.name] = shm
+        self._segment = shm.name
+        self._layout = [(offset, a.dtype.str, a.shape) for offset, a in zip(offsets, arrays)]
+        for a, offset in zip(arrays, offsets):
+            np.ndarray(a.shape, a.dtype, buffer=shm.buf, offset=offset)[...] = a
+        self._mapArrays()
+        return self._segment
+
+    def release(self) -> None:
+        """
+        Annulla una chiamata a `share`. All'ultima chiamata gli array vengono copiati in memoria privata
+        e il segmento di memoria condivisa viene eliminato
+        """
+        if self._segment is None or self._shareCount == 0:
+            return
+        self._shareCount -= 1
+        if self._shareCount > 0:
+            return
+        self.labels = self.labels.copy()
+        self.values = {name: values.copy() for name, values in self.values.items()}
+        shm = _segments.pop(self._segment)
+        self._segment = None
+        try:
+            shm.close()
+        except BufferError:
+            pass  # esistono ancora altre viste sul segmento: la memoria verra' liberata quando non saranno piu' utilizzate
+        shm.unlink()
+
+    def _mapArrays(self) -> None:
+        """
+        Crea gli array del dataset come viste sul segmento di memoria condivisa
+        """
+        buffer = _segments[self._segment].buf
+        views = [np.ndarray(shape, np.dtype(dtype), buffer=buffer, offset=offset) for offset, dtype, shape in self._layout]
+        self.labels = views[0]
+        self.values = dict(zip(self.columns, views[1:]))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._segment is not None:
+            # gli array si trovano in memoria condivisa: viene serializzata solo la loro posizione
+            del state["labels"]
+            del state["values"]
+        state["_shareCount"] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._segment is not None:
+            attach([self._segment])
+            self._mapArrays()
+
+
+class PredictionStore:
+    """
+    Archivio in memoria condivisa delle predizioni degli alberi del GA (vedi PredictionBasedFitness.predictions).
+    L'archivio e' diviso in `slots` posizioni di uguale dimensione: ogni posizione contiene le predizioni di un albero su tutti i dataset.
+    I task del Pool ricevono e restituiscono solo il numero della posizione, i processi leggono e scrivono le predizioni
+    direttamente nel segmento di memoria condivisa: le predizioni non vengono mai serializzate.
+    Le posizioni vengono assegnate dal processo che ha creato l'archivio, che ne conta i riferimenti
+
+    Methods
+    -------
+    allocate() -> int | None
+        Assegna una posizione libera
+    retain(slot: int) -> None
+        Aggiunge un riferimento a una posizione
+    free(slot: int) -> None
+        Rimuove un riferimento a una posizione, che torna libera all'ultimo riferimento
+    read(slot: int) -> list[numpy.ndarray]
+        Predizioni contenute in una posizione
+    write(slot: int, predictions: list[numpy.ndarray]) -> None
+        Scrive le predizioni in una posizione
+    share() -> str
+        Crea il segmento di memoria condivisa
+    release() -> None
+        Elimina il segmento di memoria condivisa
+    """
+
+    def __init__(self, datasets: list[EncodedDataset], slots: int):
+        """
+        Parameters
+        ----------
+        datasets: list[EncodedDataset]
+            dataset su cui vengono calcolate le predizioni: ogni predizione ha la lunghezza e il tipo delle classificazioni del dataset
+        slots: int
+            numero di posizioni dell'archivio
+        """
+        self._layout: list[tuple[int, str, int]] = list()  # (offset nella posizione, tipo, lunghezza) delle predizioni di ogni dataset
+        size = 0
+        for dataset in datasets:
+            size += -size % 8  # allineamento a 8 byte
+            self._layout.append((size, dataset.labels.dtype.str, len(dataset)))
+            size += dataset.labels.nbytes
+        self._slotSize: int = size + -size % 8
+        self.slots: int = slots
+        self._refs: list[int] = [0] * slots                  # numero di riferimenti di ogni posizione (solo nel processo che ha creato l'archivio)
+        self._free: list[int] = list(range(slots - 1, -1, -1))  # posizioni libere
+        self._segment: str | None = None
+
+    def allocate(self) -> int | None:
+        """
+        Assegna una posizione libera, con un riferimento. Restituisce None se l'archivio e' pieno
+        """
+        if len(self._free) == 0:
+            return None
+        slot = self._free.pop()
+        self._refs[slot] = 1
+        return slot
+
+    def retain(self, slot: int) -> None:
+        """
+        Aggiunge un riferimento alla posizione: non verra' riassegnata finche' il riferimento non viene rimosso con `free`
+        """
+        self._refs[slot] += 1
+
+    def free(self, slot: int) -> None:
+        """
+        Rimuove un riferimento alla posizione. Senza piu' riferimenti, la posizione torna libera
+        """
+        self._refs[slot] -= 1
+        if self._refs[slot] == 0:
+            self._free.append(slot)
+
+    def read(self, slot: int) -> list[np.ndarray]:
+        """
+        Restituisce le predizioni contenute nella posizione, come viste (in sola lettura) sul segmento di memoria condivisa
+        """
+        buffer = _segments[self._segment].buf
+        views = list()
+        for offset, dtype, length in self._layout:
+            view = np.ndarray(length, np.dtype(dtype), buffer=buffer, offset=slot * self._slotSize + offset)
+            view.flags.writeable = False
+            views.append(view)
+        return views
+
+    def write(self, slot: int, predictions: list[np.ndarray]) -> None:
+        """
+        Scrive le predizioni (una per dataset, come restituite da PredictionBasedFitness.predictions) nella posizione
+        """
+        buffer = _segments[self._segment].buf
+        for (offset, dtype, length), p in zip(self._layout, predictions):
+            np.ndarray(length, np.dtype(dtype), buffer=buffer, offset=slot * self._slotSize + offset)[...] = p
+
+    def share(self) -> str:
+        """
+        Crea il segmento di memoria condivisa dell'archivio. Deve essere seguita da una chiamata a `release`
+
+        Return
+        ------
+        str: nome del segmento di memoria condivisa
+        """
+        shm = SharedMemory(create=True, size=max(self.slots * self._slotSize, 1))
+        _segments[shm.name] = shm
+        self._segment = shm.name
+        return self._segment
+
+    def release(self) -> None:
+        """
+        Elimina il segmento di memoria condivisa dell'archivio
+        """
+        if self._segment is None:
+            return
+        shm = _segments.pop(self._segment)
+        self._segment = None
+        try:
+            shm.close()
+        except BufferError:
+            pass  # esistono ancora altre viste sul segmento: la memoria verra' liberata quando non saranno piu' utilizzate
+        shm.unlink()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # le posizioni vengono assegnate solo dal processo che ha creato l'archivio
+        del state["_refs"]
+        del state["_free"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._segment is not None:
+            attach([self._segment])
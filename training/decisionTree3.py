@@ -1,9 +1,32 @@
 from __future__ import annotations
 import copy
+import hashlib
+import numbers
 import random
 from datetime import datetime
 import pickle
+from typing import Callable, TYPE_CHECKING
+
 import graphviz
+import numpy as np
+import pandas
+
+from training.dataset import EncodedDataset
+
+if TYPE_CHECKING:
+    from game.gameInstance import GameInstance
+
+
+def _canonical(value: any) -> str:
+    """
+    Rappresentazione testuale di un valore (threshold, label o output) indipendente dal suo tipo concreto:
+    per esempio 5, 5.0 e numpy.int64(5) hanno la stessa rappresentazione
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return repr(bool(value))
+    if isinstance(value, numbers.Number):
+        return repr(float(value))
+    return repr(value)
 
 
 class Domain:
@@ -51,6 +74,10 @@ class FeatureSet(dict):
         restituisce True se una feature ha un ordinamento, False altrimenti
     toCsv(dictionary: dict[str, any] = None, **kwargs) -> str
         Permette la conversione da dizionario a stringa formattata come csv.
+    columns() -> list[str]
+        restituisce i nomi delle features nell'ordine delle colonne
+    compile(fill: Callable[[GameInstance, numpy.ndarray], None]) -> RowExtractor
+        crea un estrattore che scrive i valori delle features in una riga preallocata
     """
 
     def __init__(self):
@@ -112,10 +139,61 @@ class FeatureSet(dict):
         """
         return ','.join([str(dictionary[f]) for f in self.keys()])
 
+    def columns(self) -> list[str]:
+        """
+        Restituisce i nomi delle features nell'ordine delle colonne (lo stesso del file csv e delle righe di un RowExtractor)
+        """
+        return list(self.keys())
+
+    def compile(self, fill: Callable[[GameInstance, np.ndarray], None]) -> RowExtractor:
+        """
+        Fissa l'ordine delle colonne e restituisce un estrattore che scrive i valori delle features in una riga NumPy preallocata,
+        invece di costruire un dizionario a ogni passo di gioco
+
+        Parameters
+        ----------
+        fill: Callable[[GameInstance, numpy.ndarray], None]
+            funzione che scrive in `row[i]` il valore della feature `columns()[i]` osservato nello stato di gioco
+
+        Return
+        ------
+        RowExtractor: l'estrattore
+        """
+        return RowExtractor(self.columns(), fill)
+
     def __str__(self):
         return ','.join(self.keys())
 
 
+class RowExtractor:
+    """
+    Estrattore di features "compilato" da un FeatureSet (vedi `FeatureSet.compile`): i valori vengono scritti per posizione
+    in una riga riutilizzata a ogni chiamata, senza formattare e cercare i nomi delle features.
+    Il risultato va usato (o copiato) prima della chiamata successiva
+
+    Methods
+    -------
+    toDict(row: numpy.ndarray) -> dict[str, any]
+        converte una riga nel dizionario "feature: value" restituito dagli estrattori tradizionali
+    extract(gi: GameInstance) -> dict[str, any]
+        estrattore tradizionale equivalente: restituisce il dizionario "feature: value"
+    """
+    def __init__(self, columns: list[str], fill: Callable[[GameInstance, np.ndarray], None]):
+        self.columns: list[str] = columns
+        self.fill = fill
+        self.row: np.ndarray = np.empty(len(columns), dtype=object)
+
+    def __call__(self, gi: GameInstance) -> np.ndarray:
+        self.fill(gi, self.row)
+        return self.row
+
+    def toDict(self, row: np.ndarray) -> dict[str, any]:
+        return dict(zip(self.columns, row.tolist()))
+
+    def extract(self, gi: GameInstance) -> dict[str, any]:
+        return self.toDict(self(gi))
+
+
 class DecisionNode:
     """
     Struttura dati di un nodo di un albero decisionale
@@ -163,6 +241,16 @@ class DecisionNode:
         n.setParent(self.parent, self.label)
         return n
 
+    def copy(self) -> DecisionNode:
+        """
+        Copia del nodo (i label dei rami e gli output non vengono copiati, sono valori immutabili)
+        """
+        n = DecisionNode(self.feature, self.threshold, self.out)
+        n.children = self.children.copy()
+        n.parent = self.parent
+        n.label = self.label
+        return n
+
     def setParent(self, parentId: int, label: any):
         """
         Setta il parent di un nodo
@@ -198,13 +286,16 @@ class DecisionNode:
 
 class DecisionTree:
     """
-    Struttura dati di un albero decisionale
+    Struttura dati di un albero decisionale.
+    Alberi ottenuti con `fork` condividono i nodi non modificati (copy-on-write): un nodo va modificato solo
+    dopo averlo ottenuto con `writable`. I metodi dell'albero che lo modificano (add, removeSubtree, removeNode, graft) lo fanno gia'
     """
 
     def __init__(self, features: FeatureSet = None):
         self.features: FeatureSet = features
         self.uuid: int = 0  # Identificativo per il prossimo nodo che viene aggiunto all'albero
         self.nodes: dict[int, DecisionNode] = dict()  # key = identificativo nodo, value = nodo corrispondente
+        self._owned: set[int] = set()  # nodi appartenenti solo a questo albero, gli altri possono essere condivisi con altri alberi
 
     def __deepcopy__(self, memo):
         """
@@ -214,8 +305,55 @@ class DecisionTree:
         t.features = self.features
         t.nodes = copy.deepcopy(self.nodes, memo)
         t.uuid = self.uuid
+        t._owned = set(t.nodes)
+        return t
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # nodi condivisi con alberi serializzati insieme a questo restano condivisi anche dopo la deserializzazione:
+        # per sicurezza, nessun nodo viene considerato proprio
+        state.pop("_owned", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._owned = set()
+
+    def fork(self) -> DecisionTree:
+        """
+        Restituisce una copia dell'albero che condivide i nodi con l'originale: un nodo viene copiato solo quando
+        uno dei due alberi lo modifica (vedi `writable`). Il costo della copia non dipende dai nodi ma solo dal dizionario che li contiene
+
+        Return
+        ------
+        DecisionTree: copia dell'albero
+        """
+        t = DecisionTree(self.features)
+        t.nodes = self.nodes.copy()
+        t.uuid = self.uuid
+        self._owned = set()  # da ora anche i nodi dell'originale sono condivisi
         return t
 
+    def writable(self, nodeId: int) -> DecisionNode:
+        """
+        Restituisce il nodo pronto per essere modificato: se e' condiviso con altri alberi (vedi `fork`) viene prima copiato
+
+        Parameters
+        ----------
+        nodeId: int
+            uuid del nodo
+
+        Return
+        ------
+        DecisionNode: il nodo, appartenente solo a questo albero
+        """
+        if nodeId in self._owned:
+            return self.nodes[nodeId]
+        n = self.nodes[nodeId].copy()
+        self.nodes[nodeId] = n
+        self._owned.add(nodeId)
+        return n
+
     @classmethod
     def load(cls, filePath: str) -> DecisionTree:
         """
@@ -274,8 +412,9 @@ class DecisionTree:
         """
         node.setParent(parentId, label)
         self.nodes[self.uuid] = node
+        self._owned.add(self.uuid)
         if parentId is not None:
-            self.nodes.get(parentId).children[label] = self.uuid  # Aggiunta nodo attuale con la rispettiva label tra i children del parent
+            self.writable(parentId).children[label] = self.uuid  # Aggiunta nodo attuale con la rispettiva label tra i children del parent
         self.uuid += 1          # incremento del uuid per il prossimo nodo
         return self.uuid - 1    # return dell'uuid del nodo appena aggiunto
 
@@ -306,6 +445,138 @@ class DecisionTree:
             n = self.nodes.get(nodeId)  # scende al figlio
         return n.out  # valore di output o di default
 
+    def predictBatch(self, frame: pandas.DataFrame | np.ndarray | EncodedDataset) -> np.ndarray:
+        """
+        Predice l'output di tutte le istanze di un dataset con un'unica visita dell'albero (vedi CompiledTree.predictBatch)
+
+        Parameters
+        ----------
+        frame: pandas.DataFrame | numpy.ndarray | EncodedDataset
+            istanze da classificare. Se e' una matrice NumPy, le colonne devono seguire l'ordine delle features nel FeatureSet
+
+        Return
+        ------
+        numpy.ndarray: predizione di ogni istanza, nello stesso ordine delle righe in input
+        """
+        return self.compile().predictBatch(frame)
+
+    def compile(self) -> CompiledTree:
+        """
+        Restituisce una copia "congelata" dell'albero organizzata in array contigui, da usare per l'inferenza.
+        La copia non segue le modifiche successive dell'albero
+
+        Return
+        ------
+        CompiledTree: albero compilato
+        """
+        return CompiledTree(self)
+
+    def structuralHash(self) -> str:
+        """
+        Restituisce un hash della struttura dell'albero. L'hash non dipende dagli uuid dei nodi ne' dall'ordine in cui sono stati
+        inseriti i figli: due alberi con lo stesso hash hanno gli stessi test e gli stessi output, quindi le stesse predizioni
+
+        Return
+        ------
+        str: hash esadecimale dell'albero
+        """
+        # ordine di visita in pre-ordine: scorrendolo al contrario, ogni nodo viene elaborato dopo tutti i suoi figli
+        order = list()
+        stack = [0]
+        while len(stack) > 0:
+            nodeId = stack.pop()
+            order.append(nodeId)
+            stack.extend(self.nodes[nodeId].getChildren())
+
+        digests = dict()  # key = id nodo, value = hash del sotto albero radicato nel nodo
+        for nodeId in reversed(order):
+            n = self.nodes[nodeId]
+            h = hashlib.blake2b(repr((n.feature, _canonical(n.threshold), _canonical(n.out))).encode(), digest_size=16)
+            for label, digest in sorted((_canonical(label), digests[childId]) for label, childId in n.children.items()):
+                h.update(label.encode())
+                h.update(digest)
+            digests[nodeId] = h.digest()
+        return digests[0].hex()
+
+    def changedNodes(self, reference: DecisionTree) -> list[int]:
+        """
+        Confronta l'albero con un albero di riferimento (per esempio il genitore da cui e' stato ottenuto con crossover e mutazione)
+        e restituisce i nodi radice dei sotto alberi che differiscono dal riferimento.
+        Tutti i nodi al di fuori dei sotto alberi restituiti coincidono con quelli del riferimento nella stessa posizione
+
+        Parameters
+        ----------
+        reference: DecisionTree
+            albero di riferimento
+
+        Return
+        ------
+        list[int]: uuid dei nodi (di questo albero) radice dei sotto alberi modificati. [0] se e' cambiata la radice
+        """
+        changed = list()
+        stack = [(0, 0)]  # Lo stack contiene tuple del tipo (id nodo di questo albero, id nodo nella stessa posizione del riferimento)
+        while len(stack) > 0:
+            nodeId, referenceId = stack.pop()
+            n = self.nodes[nodeId]
+            r = reference.nodes[referenceId]
+            if n.feature != r.feature or n.threshold != r.threshold or n.out != r.out or n.children.keys() != r.children.keys():
+                changed.append(nodeId)  # e' cambiato il nodo stesso: tutto il suo sotto albero va considerato modificato
+                continue
+            stack.extend((childId, r.children[label]) for label, childId in n.children.items())
+        return changed
+
+    def updatePredictions(self, datasets: list[EncodedDataset], reference: DecisionTree, referencePredictions: list[np.ndarray]) -> list[np.ndarray]:
+        """
+        Calcola le predizioni dell'albero (come CompiledTree.predictLabels) partendo da quelle di un albero di riferimento:
+        vengono ri-classificate solo le righe che raggiungono i sotto alberi modificati rispetto al riferimento (vedi `changedNodes`)
+
+        Parameters
+        ----------
+        datasets: list[EncodedDataset]
+            istanze da classificare
+        reference: DecisionTree
+            albero di riferimento
+        referencePredictions: list[numpy.ndarray]
+            predizioni dell'albero di riferimento su ogni dataset
+
+        Return
+        ------
+        list[numpy.ndarray]: per ogni dataset, codice della classificazione predetta per ogni istanza
+        """
+        changed = self.changedNodes(reference)
+        if len(changed) == 0:
+            return referencePredictions
+        compiled = self.compile()
+        if 0 in changed:
+            return [compiled.predictLabels(dataset) for dataset in datasets]
+        result = list()
+        for dataset, predictions in zip(datasets, referencePredictions):
+            predictions = predictions.copy()
+            for nodeId in changed:
+                rows = self._reachingRows(dataset, nodeId)
+                predictions[rows] = compiled.predictLabels(dataset, rows, nodeId)
+            result.append(predictions)
+        return result
+
+    def _reachingRows(self, dataset: EncodedDataset, nodeId: int) -> np.ndarray:
+        """
+        Restituisce gli indici delle righe del dataset che, interrogando l'albero, raggiungono il nodo dato
+        """
+        path = list()  # cammino (nodo, label del ramo da seguire) dalla radice al nodo
+        n = self.nodes[nodeId]
+        while not n.isRoot():
+            path.append((n.parent, n.label))
+            n = self.nodes[n.parent]
+        rows = np.arange(len(dataset))
+        for parentId, label in reversed(path):
+            p = self.nodes[parentId]
+            if self.features[p.feature].isNumerical():
+                mask = dataset.lessThan(p.feature, p.threshold, rows)
+                rows = rows[mask if label else ~mask]
+            else:
+                rows = rows[dataset.values[p.feature][rows] == dataset.encode(p.feature, label)]
+        return rows
+
     def queryNode(self, featuresValues: dict[str, any], nodeId: int = 0) -> int | None:
         """
         Interroga un singolo nodo dell'albero e restituisce il figlio "corrispondente"
@@ -342,13 +613,16 @@ class DecisionTree:
         # Se il nodo e' la radice dell'albero, rimuove direttamente tutto l'albero e riazzera gli uuid
         if n.isRoot():
             self.nodes.clear()
+            self._owned.clear()
             self.uuid = 0
             return
         stack = [nodeId]                                # Stack con i nodi da eliminare
-        self.nodes.get(n.parent).children.pop(n.label)  # Elimina il nodo corrente dai children del proprio parent
+        self.writable(n.parent).children.pop(n.label)   # Elimina il nodo corrente dai children del proprio parent
         while len(stack) > 0:                           # Finche' ci sono nodi da eliminare
-            n = self.nodes.pop(stack.pop())             # Rimuovi il nodo dall'albero
-            stack.extend(n.getChildren())               # Inserisci tutti i figli nello stack per farli rimuovere dall'albero
+            removedId = stack.pop()
+            n = self.nodes.pop(removedId)               # Rimuovi il nodo dall'albero
+            self._owned.discard(removedId)
+            stack.extend(n.children.values())           # Inserisci tutti i figli nello stack per farli rimuovere dall'albero
 
     def removeNode(self, nodeId: int, branch: str) -> int:
         """
@@ -365,7 +639,7 @@ class DecisionTree:
         ------
         int: id del nodo che ha preso il suo posto (id del nodo figlio che lo ha rimpiazzato)
         """
-        n = self.nodes[nodeId]
+        n = self.writable(nodeId)
         replacerId = n.children.pop(branch, None)  # Rimuove 'branch' dai figli del nodo. Restituisce None se non esiste
         parent = n.parent
         label = n.label
@@ -380,8 +654,8 @@ class DecisionTree:
         if not replacerId:
             return self.add(DecisionNode(out=out), parent, label)
 
-        replacer = self.nodes[replacerId]                   # nodo che rimpiazza il nodeId
-        self.nodes[parent].children[label] = replacerId     # inserisce il nodo tra i figli del parent del nodo rimosso
+        replacer = self.writable(replacerId)                # nodo che rimpiazza il nodeId
+        self.writable(parent).children[label] = replacerId  # inserisce il nodo tra i figli del parent del nodo rimosso
         replacer.setParent(parent, label)                   # setta il nuovo parent e il label al nodo
         return replacerId
 
@@ -427,20 +701,37 @@ class DecisionTree:
         ------
         int: uuid nodo radice del sotto albero inserito
         """
-        n = copy.deepcopy(self.nodes.get(nodeId))
-        self.removeSubtree(nodeId)  # Rimuove sottoalbero di nodeId
+        return self.graft(nodeId, decisionTree, 0)
 
-        sn = copy.deepcopy(decisionTree.nodes.get(0))  # prende la radice dell'albero in input
-        idNode = self.add(sn, n.parent, n.label)  # aggiunge sn all'albero (verra' attaccato al parent di n)
+    def graft(self, nodeId: int, source: DecisionTree, sourceId: int) -> int:
+        """
+        Rimpiazza il sotto albero radicato nel nodeId con una copia del sotto albero di `source` radicato nel sourceId.
+        A differenza di `extract` seguito da `substitute`, i nodi di `source` vengono copiati una sola volta e `source` non viene modificato
 
-        stack = [(idNode, x) for x in sn.getChildren()]  # frontiera di nodi da inserire nell'albero
+        Parameters
+        ----------
+        nodeId: int
+            uuid del nodo da rimpiazzare
+        source: DecisionTree
+            albero da cui copiare il sotto albero, diverso da questo (puo' pero' condividerne i nodi, vedi `fork`)
+        sourceId: int
+            uuid (in `source`) della radice del sotto albero da copiare
 
-        # Inserisce tutti i nodi dell'albero in input
+        Return
+        ------
+        int: uuid nodo radice del sotto albero inserito
+        """
+        n = self.nodes[nodeId]
+        parentId, label = n.parent, n.label
+        self.removeSubtree(nodeId)  # Rimuove sottoalbero di nodeId
+        root = source.nodes[sourceId]
+        idNode = self.add(DecisionNode(root.feature, root.threshold, root.out), parentId, label)
+        # frontiera di nodi da inserire nell'albero: (uuid del parent nell'albero, label del ramo, nodo di `source`)
+        stack = [(idNode, childLabel, source.nodes[childId]) for childLabel, childId in root.children.items()]
         while len(stack) > 0:
-            parentId, id = stack.pop()
-            node = copy.deepcopy(decisionTree.nodes.get(id))
-            newUuid = self.add(node, parentId, node.label)
-            stack.extend([(newUuid, x) for x in node.getChildren()])
+            parent, childLabel, sn = stack.pop()
+            newUuid = self.add(DecisionNode(sn.feature, sn.threshold, sn.out), parent, childLabel)
+            stack.extend((newUuid, l, source.nodes[c]) for l, c in sn.children.items())
         return idNode
 
     def printToFile(self, fileName: str) -> None:
@@ -474,3 +765,282 @@ class DecisionTree:
                 g.edge(str(n.parent), str(id), str(n.label))  # inserisce arco tra il parent e il nodo, sull'arco viene scritto il label del nodo
             queue.extend(n.getChildren())
         g.render(cleanup=True)
+
+
+class CompiledTree:
+    """
+    Rappresentazione di un DecisionTree in array contigui, usata per l'inferenza.
+    I nodi sono numerati in pre-ordine (la radice ha indice 0) e ogni nodo e' descritto dalla posizione corrispondente degli array:
+    - feature[i]: indice della feature in `featureNames`, -1 se il nodo e' una foglia
+    - numerical[i]: True se la feature del nodo e' numerica
+    - threshold[i]: valore di threshold dei nodi numerici
+    - children[i]: indici dei figli sui rami True (colonna 0) e False (colonna 1) dei nodi numerici, -1 se il ramo non esiste
+    - branchStart[i]:branchStart[i+1]: intervallo di `branchLabel` e `branchChild` con i rami dei nodi non numerici
+    - out[i]: codice dell'output del nodo, l'output vero e proprio e' `outputs[out[i]]`
+
+    Methods
+    -------
+    predict(featuresValues: dict[str, any]) -> any
+        Dato un esempio come dizionario "feature: value", predice l'output
+    withColumns(columns: list[str]) -> CompiledTree
+        Restituisce una copia dell'albero che indica le features con la loro posizione in `columns`
+    predictRow(row: numpy.ndarray | list) -> any
+        Dato un esempio come riga di valori (nell'ordine di `featureNames`), predice l'output
+    predictBatch(frame: pandas.DataFrame | numpy.ndarray | EncodedDataset) -> numpy.ndarray
+        Predice l'output di tutte le istanze di un dataset
+    predictLabels(dataset: EncodedDataset) -> numpy.ndarray
+        Predice le classificazioni di tutte le istanze di un dataset codificato
+    """
+
+    def __init__(self, tree: DecisionTree):
+        self.featureNames: list[str] = list(tree.features.keys())
+        self.outputs: list = list()
+        positions = {f: i for i, f in enumerate(self.featureNames)}
+        outCodes = dict()
+
+        # numerazione dei nodi in pre-ordine
+        order = list()
+        stack = [0]
+        while len(stack) > 0:
+            nodeId = stack.pop()
+            order.append(nodeId)
+            stack.extend(reversed(tree.nodes[nodeId].getChildren()))
+        index = {nodeId: i for i, nodeId in enumerate(order)}
+        self.index: dict[int, int] = index  # key = uuid del nodo nel DecisionTree, value = indice del nodo negli array
+
+        size = len(order)
+        self.feature = np.full(size, -1, dtype=np.int32)
+        self.numerical = np.zeros(size, dtype=bool)
+        self.threshold = np.full(size, np.nan)
+        self.children = np.full((size, 2), -1, dtype=np.int32)
+        self.branchStart = np.zeros(size + 1, dtype=np.int32)
+        self.out = np.empty(size, dtype=np.int32)
+        branchLabel = list()
+        branchChild = list()
+        for i, nodeId in enumerate(order):
+            n = tree.nodes[nodeId]
+            if n.out not in outCodes:
+                outCodes[n.out] = len(self.outputs)
+                self.outputs.append(n.out)
+            self.out[i] = outCodes[n.out]
+            if len(n.children) > 0:
+                self.feature[i] = positions[n.feature]
+                if tree.features[n.feature].isNumerical():
+                    self.numerical[i] = True
+                    self.threshold[i] = n.threshold
+                    self.children[i] = [index.get(n.children.get(True), -1), index.get(n.children.get(False), -1)]
+                else:
+                    for label, childId in n.children.items():
+                        branchLabel.append(label)
+                        branchChild.append(index[childId])
+            self.branchStart[i + 1] = len(branchLabel)
+        self.branchLabel = np.empty(len(branchLabel), dtype=object)
+        self.branchLabel[:] = branchLabel
+        self.branchChild = np.array(branchChild, dtype=np.int32)
+        self._tables: tuple | None = None  # tabelle usate da `predictRow`, costruite alla prima chiamata
+
+    def __len__(self):
+        return self.out.size
+
+    def predict(self, featuresValues: dict[str, any]) -> any:
+        """
+        Dato un esempio come dizionario "feature: value", predice l'output (come DecisionTree.predict)
+
+        Parameters
+        ----------
+        featuresValues: dict[str, any]
+            dizionario tale che key=nomeFeature, value:valoreFeature
+
+        Return
+        ------
+        any: output predetto
+        """
+        i = 0
+        f = self.feature[i]
+        while f >= 0:
+            value = featuresValues.get(self.featureNames[f])
+            if self.numerical[i]:
+                nextI = self.children[i, 0 if value < self.threshold[i] else 1]
+            else:
+                nextI = -1
+                for b in range(self.branchStart[i], self.branchStart[i + 1]):
+                    if self.branchLabel[b] == value:
+                        nextI = self.branchChild[b]
+                        break
+            # valore non osservato durante il training: viene restituito l'output di default del nodo
+            if nextI < 0:
+                break
+            i = nextI
+            f = self.feature[i]
+        return self.outputs[self.out[i]]
+
+    def withColumns(self, columns: list[str]) -> CompiledTree:
+        """
+        Restituisce una copia dell'albero in cui le features sono indicate dalla loro posizione in `columns`,
+        cosi' `predictRow` puo' leggere direttamente le righe di un RowExtractor
+
+        Parameters
+        ----------
+        columns: list[str]
+            ordine delle colonne (vedi FeatureSet.columns)
+
+        Return
+        ------
+        CompiledTree: albero con `featureNames` uguale a `columns`
+        """
+        positions = {f: i for i, f in enumerate(columns)}
+        missing = [f for f in self.featureNames if f not in positions]
+        if len(missing) > 0:
+            raise ValueError(f"Features {missing} are not in the given columns")
+        mapping = np.array([positions[f] for f in self.featureNames] + [-1], dtype=np.int32)  # l'ultimo elemento e' per le foglie
+        tree = copy.copy(self)
+        tree.featureNames = list(columns)
+        tree.feature = mapping[self.feature]
+        tree._tables = None
+        return tree
+
+    def predictRow(self, row: np.ndarray | list) -> any:
+        """
+        Come `predict`, ma l'esempio e' una riga con i valori delle features nell'ordine di `featureNames` (vedi `withColumns`)
+
+        Parameters
+        ----------
+        row: numpy.ndarray | list
+            valori delle features, per posizione
+
+        Return
+        ------
+        any: output predetto
+        """
+        if self._tables is None:
+            # la visita usa liste e dizionari Python: leggere singoli elementi da un array NumPy costa di piu'
+            branches = [{self.branchLabel[b]: int(self.branchChild[b]) for b in range(self.branchStart[i], self.branchStart[i + 1])}
+                        for i in range(len(self))]
+            self._tables = (self.feature.tolist(), self.numerical.tolist(), self.threshold.tolist(),
+                            self.children[:, 0].tolist(), self.children[:, 1].tolist(), branches, self.out.tolist())
+        feature, numerical, threshold, left, right, branches, out = self._tables
+        i = 0
+        f = feature[0]
+        while f >= 0:
+            value = row[f]
+            if numerical[i]:
+                nextI = left[i] if value < threshold[i] else right[i]
+            else:
+                nextI = branches[i].get(value, -1)
+            # valore non osservato durante il training: viene restituito l'output di default del nodo
+            if nextI < 0:
+                break
+            i = nextI
+            f = feature[i]
+        return self.outputs[out[i]]
+
+    def predictBatch(self, frame: pandas.DataFrame | np.ndarray | EncodedDataset) -> np.ndarray:
+        """
+        Predice l'output di tutte le istanze di un dataset con un'unica visita dell'albero
+
+        Parameters
+        ----------
+        frame: pandas.DataFrame | numpy.ndarray | EncodedDataset
+            istanze da classificare. Se e' una matrice NumPy, le colonne devono seguire l'ordine di `featureNames`
+
+        Return
+        ------
+        numpy.ndarray: predizione di ogni istanza, nello stesso ordine delle righe in input
+        """
+        if isinstance(frame, np.ndarray):
+            frame = pandas.DataFrame(frame, columns=self.featureNames)
+        outputs = np.empty(len(self.outputs), dtype=object)
+        outputs[:] = self.outputs
+        return outputs[self._route(EncodedDataset.of(frame))]
+
+    def predictColumns(self, columns: dict[str, list]) -> np.ndarray:
+        """
+        Come `predictBatch`, ma le istanze sono date per colonne e i valori vengono confrontati senza codificarli in un EncodedDataset.
+        Conviene per classificare pochi esempi alla volta, per esempio gli stati di piu' partite a ogni passo di gioco
+
+        Parameters
+        ----------
+        columns: dict[str, list]
+            key = nome della feature, value = valori della feature, uno per istanza
+
+        Return
+        ------
+        numpy.ndarray: predizione di ogni istanza
+        """
+        outputs = np.empty(len(self.outputs), dtype=object)
+        outputs[:] = self.outputs
+        return outputs[self._route(_RawColumns(columns))]
+
+    def predictLabels(self, dataset: EncodedDataset, rows: np.ndarray = None, nodeId: int = 0) -> np.ndarray:
+        """
+        Predice le classificazioni delle istanze di un dataset codificato, restituendole come codici di `dataset.classes`
+
+        Parameters
+        ----------
+        dataset: EncodedDataset
+            istanze da classificare
+        rows: numpy.ndarray = None
+            indici delle righe da classificare. Se None, vengono classificate tutte le righe
+        nodeId: int = 0
+            uuid (nel DecisionTree originale) del nodo da cui iniziare la visita, utile per classificare solo le righe che raggiungono un sotto albero
+
+        Return
+        ------
+        numpy.ndarray: codice della classificazione predetta per ogni istanza (-1 se la predizione non e' tra le classificazioni del dataset)
+        """
+        translation = np.array([dataset.encodeLabel(o) for o in self.outputs], dtype=dataset.labels.dtype)
+        return translation[self._route(dataset, rows, self.index[nodeId])]
+
+    def _route(self, dataset: EncodedDataset, rows: np.ndarray = None, start: int = 0) -> np.ndarray:
+        """
+        Invece di interrogare l'albero riga per riga, ogni nodo riceve l'array degli indici delle righe che lo raggiungono
+        e lo partiziona tra i propri figli.
+        Restituisce il codice dell'output (indice di `outputs`) predetto per le righe indicate (tutte se None), partendo dal nodo `start`
+        """
+        selected = np.arange(len(dataset)) if rows is None else rows
+        codes = np.empty(len(dataset), dtype=np.int32)
+        partial = rows is not None
+        stack = [(start, selected)]  # Lo stack contiene tuple del tipo (indice nodo, indici delle righe che raggiungono il nodo)
+        while len(stack) > 0:
+            i, rows = stack.pop()
+            f = self.feature[i]
+            if rows.size == 0:
+                continue
+            if f < 0:  # nodo foglia
+                codes[rows] = self.out[i]
+                continue
+            name = self.featureNames[f]
+            if self.numerical[i]:
+                mask = dataset.lessThan(name, self.threshold[i], rows)
+                branches = [(self.children[i, 0], mask), (self.children[i, 1], ~mask)]
+            else:
+                values = dataset.values[name][rows]
+                branches = [(self.branchChild[b], values == dataset.encode(name, self.branchLabel[b])) for b in range(self.branchStart[i], self.branchStart[i + 1])]
+            routed = np.zeros(rows.size, dtype=bool)  # righe che hanno trovato un ramo corrispondente
+            for child, mask in branches:
+                if child >= 0:
+                    stack.append((child, rows[mask]))
+                    routed |= mask
+            # come in `predict`, le righe con un valore non osservato durante il training prendono l'output di default del nodo
+            codes[rows[~routed]] = self.out[i]
+        return codes[selected] if partial else codes
+
+
+class _RawColumns:
+    """
+    Istanze date per colonne non codificate, con la stessa interfaccia di EncodedDataset usata da `CompiledTree._route`:
+    i valori vengono confrontati direttamente con threshold e label, come in `CompiledTree.predict`
+    """
+    def __init__(self, columns: dict[str, list]):
+        self.values = {name: np.asarray(column) for name, column in columns.items()}
+        self.size = len(next(iter(columns.values()), []))
+
+    def __len__(self):
+        return self.size
+
+    def encode(self, name: str, value: any) -> any:
+        return value
+
+    def lessThan(self, name: str, threshold: any, rows: np.ndarray = None) -> np.ndarray:
+        values = self.values[name] if rows is None else self.values[name][rows]
+        return values < threshold
@@ -5,14 +5,21 @@ import pandas
 
 if TYPE_CHECKING:
     from multiprocessing.pool import ApplyResult
-    from typing import TextIO
 
 import multiprocessing
 import os
 import pickle
+import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import OrderedDict
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 import numpy as np
+from training.algorithms.fitness import PredictionBasedFitness
+from training.algorithms.selection import IndexSelection
+from training.history import HistoryStore
+from training.dataset import EncodedDataset, PredictionStore, attach, findDatasets
 from training.decisionTree3 import DecisionTree
 
 
@@ -71,6 +78,9 @@ GeneticAlgorithm = Callable[['GA'], None]
 HistoryRow = tuple[int, float, DecisionTree, float]
 History = list[HistoryRow]
 
+# Operatori del GA installati in ogni processo del Pool (vedi GA._initWorker)
+_workerOperators: dict[str, any] = dict()
+
 
 class Pack:
     """
@@ -85,7 +95,11 @@ class Pack:
                  mutation: TMutation,                   # Funzione di mutazione
                  stopCondition: TStopCondition,         # Criterio di stop
                  draws: int = 25,                       # Numero di iterazioni del crossover per ogni generazione
-                 elitismSize: int = 0):                 # Numero di elementi della popolazione corrente da mantenere nella nuova popolazione
+                 elitismSize: int = 0,                  # Numero di elementi della popolazione corrente da mantenere nella nuova popolazione
+                 chunks: int = None,                    # Numero di task in cui vengono suddivise le iterazioni del crossover
+                 fitnessCacheSize: int = 1024,          # Numero massimo di valori di fitness memorizzati nella cache
+                 checkpointInterval: int = 1,           # Ogni quante generazioni viene salvata la popolazione
+                 steadyState: bool = False):            # Esecuzione steady-state invece che per generazioni
         """
         Costruttore Pack
 
@@ -96,7 +110,8 @@ class Pack:
         fitness: TFitness
             Funzione di fitness
         selection: TSelection
-            Funzione di selezione
+            Funzione di selezione. Se e' una IndexSelection, i genitori di tutte le draws di una generazione
+            vengono estratti in una sola chiamata
         crossover: TCrossover
             Funzione di crossover
         mutation: TMutation
@@ -112,6 +127,24 @@ class Pack:
             Se diverso da 0, i migliori n individui della generazione corrente
             (con n = elitismSize) verranno inseriti nella prossima generazione
             senza essere modificati
+        chunks: int = None
+            Numero di task (per ogni generazione) in cui vengono suddivise le draws iterazioni del crossover:
+            ogni task esegue crossover e mutazione per un gruppo di coppie di genitori e restituisce tutti i figli generati.
+            Se None, viene usato un task per ogni processo del Pool
+        fitnessCacheSize: int = 1024
+            Numero massimo di valori di fitness memorizzati (vedi FitnessCache): gli alberi strutturalmente identici
+            a un albero gia' valutato non vengono valutati di nuovo. Se 0, la cache e' disabilitata
+        checkpointInterval: int = 1
+            La popolazione viene salvata (per riprendere un'esecuzione interrotta) ogni `checkpointInterval` generazioni
+            e al termine dell'esecuzione. Il salvataggio avviene in un thread separato, in parallelo alla generazione successiva.
+            Riprendendo un'esecuzione interrotta, le generazioni della history successive all'ultimo checkpoint vengono ricalcolate
+        steadyState: bool = False
+            Se True, il GA non procede per generazioni: ogni processo del Pool seleziona, riproduce e valuta una coppia di genitori
+            alla volta e ogni figlio prende subito il posto dell'individuo peggiore della popolazione (se ha un fitness migliore
+            e non e' gia' presente). I processi non attendono la valutazione piu' lenta di una generazione.
+            La popolazione mantiene la dimensione iniziale e draws, elitismSize e chunks non vengono usati;
+            history, condizione di stop e checkpoint considerano una generazione ogni len(popolazione) figli generati
+            (compresi quelli non valutati perche' gia' presenti nella cache)
         """
         self.stopCondition = stopCondition
         self.mutation = mutation
@@ -121,6 +154,77 @@ class Pack:
         self.genPopulation = populationGenerator
         self.draws = draws
         self.elitismSize = elitismSize
+        self.chunks = chunks
+        self.fitnessCacheSize = fitnessCacheSize
+        self.checkpointInterval = checkpointInterval
+        self.steadyState = steadyState
+
+
+class FitnessCache:
+    """
+    Cache LRU dei valori di fitness, indicizzata per hash strutturale degli alberi (vedi DecisionTree.structuralHash).
+    Quando la cache e' piena, viene eliminato il valore usato meno di recente
+
+    Methods
+    -------
+    get(key: str) -> float | None
+        Restituisce il fitness memorizzato, None se assente
+    put(key: str, fitness: float) -> None
+        Memorizza un valore di fitness
+    keys() -> list[str]
+        Hash degli alberi di cui e' memorizzato il fitness
+    """
+
+    def __init__(self, maxSize: int):
+        """
+        Parameters
+        ----------
+        maxSize: int
+            numero massimo di valori memorizzati. Se 0, la cache non memorizza nulla
+        """
+        self.maxSize: int = maxSize
+        self.hits: int = 0      # numero di ricerche che hanno trovato il valore
+        self.misses: int = 0    # numero di ricerche che non hanno trovato il valore
+        self._data: OrderedDict[str, float] = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str) -> float | None:
+        """
+        Restituisce il fitness memorizzato per l'albero con hash `key`, None se assente
+        """
+        fitness = self._data.get(key)
+        if fitness is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._data.move_to_end(key)
+        return fitness
+
+    def put(self, key: str, fitness: float) -> None:
+        """
+        Memorizza il fitness dell'albero con hash `key`
+        """
+        if self.maxSize <= 0:
+            return
+        self._data[key] = fitness
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxSize:
+            self._data.popitem(last=False)
+
+    def keys(self) -> list[str]:
+        """
+        Restituisce gli hash degli alberi di cui e' memorizzato il fitness
+        """
+        return list(self._data)
+
+
+def _keyPrefix(key: str) -> int:
+    """
+    Primi 64 bit di un hash strutturale: rappresentazione compatta degli hash inviati ai processi del Pool
+    """
+    return int(key[:16], 16)
 
 
 class GA:
@@ -129,18 +233,16 @@ class GA:
 
     Methods
     -------
-    loadHistory(historyPath: str) -> History
-        carica una history precedentemente salvata su file e la restituisce
-    saveHistoryRow(file: TextIO, data: HistoryRow) -> None
-        Salva su file una riga della history
+    getHistory() -> History
+        restituisce la history salvata su file (vedi `history`)
     run() -> None
         esegue il GA con le configurazioni date
     """
     # TODO: history[g] = (f,i) / array contenente i migliori individui (fitness, individuo) per ogni generazione g
 
-    HISTORY_FILE_NAME = "history.ga"
     FIRST_GEN_LOCATION = "firstgen"
-    LAST_GEN_LOCATION = "lastgen"
+    LAST_GEN_LOCATION = "lastgen"  # vecchio formato del checkpoint: un file .dtree per individuo (letto solo per riprendere esecuzioni precedenti)
+    CHECKPOINT_NAME = "population.ckpt"
     TESTING_SET_NAME = "testing.csv"
 
     def __init__(self, pack: Pack, datastorePath: str):
@@ -161,13 +263,29 @@ class GA:
         self.genPopulation: TGenPopulation = pack.genPopulation
         self.draws: int = pack.draws
         self.elitismSize: int = pack.elitismSize
+        self.chunks: int | None = pack.chunks
+        self.fitnessCache: FitnessCache = FitnessCache(pack.fitnessCacheSize)
+        self.checkpointInterval: int = pack.checkpointInterval
+        self.steadyState: bool = pack.steadyState
 
         # Internal initializations
         self.datastorePath: str = datastorePath
         self.population: list[DecisionTree] = list()
-
-        # Prova a caricare in 'self.population' ogni .dtree nella directory GA.LAST_GEN_LOCATION nel datastore;
-        # se non presente, prova a caricare i .dtree nella directory GA.FIRST_GEN_LOCATION nel datastore;
+        self.history: HistoryStore = HistoryStore(datastorePath)  # history delle generazioni, salvata nel datastore
+
+        # Prova a caricare in 'self.population' la popolazione salvata nel checkpoint GA.CHECKPOINT_NAME nel datastore;
+        # se non presente, prova a caricare ogni .dtree nella directory GA.LAST_GEN_LOCATION (vecchio formato del checkpoint)
+        # e infine i .dtree nella directory GA.FIRST_GEN_LOCATION
+        checkpoint = os.path.join(self.datastorePath, GA.CHECKPOINT_NAME)
+        # ultima generazione nella history quando la popolazione caricata e' stata salvata (None se non nota, vedi `run`)
+        self.populationGeneration: int | None = None
+        if os.path.isfile(checkpoint):
+            with open(checkpoint, "rb") as file:
+                state = pickle.load(file)
+            if isinstance(state, tuple):
+                self.populationGeneration, self.population = state
+            else:
+                self.population = state  # checkpoint salvato senza il numero di generazione
         for loc in [GA.LAST_GEN_LOCATION, GA.FIRST_GEN_LOCATION]:
             path = os.path.join(self.datastorePath, loc)
             if os.path.isdir(path):
@@ -175,62 +293,35 @@ class GA:
                     for f in os.listdir(path):
                         if f.endswith(".dtree"):
                             self.population.append(DecisionTree.load(os.path.join(path, f)))
-            else:
+                    if loc == GA.FIRST_GEN_LOCATION and len(self.population) > 0:
+                        self.populationGeneration = 0
+            elif loc == GA.FIRST_GEN_LOCATION:
                 os.mkdir(path)
 
     def getHistory(self) -> History:
         """History e' una lista di tuple della forma [<generation number>, <highest fitness>, <DecisionTree with highest fitness>, <avg Fitness>]"""
-        return GA._loadHistory(os.path.join(self.datastorePath, GA.HISTORY_FILE_NAME))
-
+        return self.history.rows()
 
-    @staticmethod
-    def _loadHistory(historyPath: str) -> History:
+    def _saveCheckpoint(self, generation: int, population: list[DecisionTree]) -> None:
         """
-        Carica una history da file
-
-        Parameters
-        ----------
-        historyPath: str
-            path del file contenente la history da caricare
-
-        Return
-        ------
-        History: la history dove ogni elemento della lista e' della forma [numGenerazione, bestFitness, DecisionTreeBestFitness, avgFitness]
+        Salva la popolazione in un unico file, insieme all'ultima generazione salvata nella history (`generation`).
+        Il file viene scritto a parte e poi sostituito al precedente, cosi' un'interruzione durante il salvataggio
+        lascia intatto l'ultimo checkpoint completo
         """
-        data = list()
-        if os.path.isfile(historyPath):
-            with open(historyPath, "r") as file:
-                line = file.readline()
-                while line:
-                    data.append(pickle.loads(bytes.fromhex(line)))
-                    line = file.readline()
-        return data
-
-    @staticmethod
-    def saveHistoryRow(file: TextIO, data: HistoryRow) -> None:
-        """
-        Salva su file una riga di history
-
-        Parameters
-        ----------
-        file: todo
-        data: HistoryRow
-            i dati da caricare nel file. Sono della forma [numGenerazione, bestFitness, DecisionTreeBestFitness, avgFitness]
-        """
-        file.write(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL).hex() + "\n")
+        path = os.path.join(self.datastorePath, GA.CHECKPOINT_NAME)
+        with open(f"{path}.tmp", "wb") as file:
+            pickle.dump((generation, population), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
 
     def getAccuracy(self):
         print("[GA] - start accuracy")
-        testingSet = pandas.read_csv(os.path.join(self.datastorePath, GA.TESTING_SET_NAME), index_col=0)
+        testingSet = EncodedDataset(pandas.read_csv(os.path.join(self.datastorePath, GA.TESTING_SET_NAME), index_col=0))
         history = self.getHistory()
         accuracyVector = []
         for g in history:
             tree = g[2]
-            correctPredictions = 0
-            for i, row in testingSet.iterrows():
-                if tree.predict(row.to_dict()) == i:
-                    correctPredictions += 1
-            accuracy = correctPredictions / testingSet.index.size
+            correctPredictions = np.count_nonzero(tree.compile().predictLabels(testingSet) == testingSet.labels)
+            accuracy = correctPredictions / len(testingSet)
             accuracyVector.append(accuracy)
             print(f"[GA] - best tree accuracy gen {g[0]}: {round(accuracy*100, 2)}")
         return accuracyVector
@@ -246,14 +337,11 @@ class GA:
         accuracy: bool
             Inserisce nel grafico anche l'andamento dell'accuratezza degli alberi
         """
-        history = self.getHistory()
-        xdata = []
-        bestFitness = []
-        avgFitness = []
-        for g, mF, _, avgF in history:
-            xdata.append(g)
-            bestFitness.append(mF)
-            avgFitness.append(avgF)
+        # il grafico usa solo gli scalari della history: gli alberi non vengono letti
+        scalars = self.history.scalars()
+        xdata = scalars["generation"]
+        bestFitness = scalars["bestFitness"]
+        avgFitness = scalars["avgFitness"]
         fig, ax = plt.subplots()
         ax.plot(xdata, bestFitness, label="bestFitness")
         ax.plot(xdata, avgFitness, label="avgFitness")
@@ -270,78 +358,387 @@ class GA:
         plt.savefig(outFile + ".png")
 
     @staticmethod
-    def _worker(selectionFunction, crossoverFunction, mutationFunction, population, fitnessPopulation):
+    def _initWorker(fitness: TFitness, crossover: TCrossover, mutation: TMutation, segments: list[str], store: PredictionStore | None):
+        """
+        Initializer dei processi del Pool: collega i dataset condivisi e installa gli operatori del GA (e l'archivio delle predizioni)
+        una sola volta per processo, cosi' i task devono contenere solo gli alberi su cui lavorare
+        """
+        attach(segments)
+        _workerOperators["fitness"] = fitness
+        _workerOperators["crossover"] = crossover
+        _workerOperators["mutation"] = mutation
+        _workerOperators["predictions"] = store
+
+    @staticmethod
+    def _evaluate(elem: DecisionTree, slot: int | None) -> float:
         """
-        Funzione usata per la multiprogrammazione
+        Funzione usata per la multiprogrammazione: calcola il fitness di un albero con la funzione installata nel processo.
+        Se il fitness e' un PredictionBasedFitness e `slot` non e' None, le predizioni dell'albero vengono scritte in quella posizione
+        dell'archivio delle predizioni
         """
-        parents = selectionFunction(population, fitnessPopulation)
-        newElements = crossoverFunction(parents)
-        for e in newElements:
-            mutationFunction(e)
+        fitness = _workerOperators["fitness"]
+        if isinstance(fitness, PredictionBasedFitness):
+            predictions = fitness.predictions(elem)
+            if slot is not None:
+                _workerOperators["predictions"].write(slot, predictions)
+            return fitness.score(predictions)
+        return fitness(elem)
+
+    @staticmethod
+    def _worker(tasks: list[tuple[list[tuple[DecisionTree, int | None]], list[int | None]]], skip: frozenset[int]) -> list[tuple[DecisionTree, str, float | None, int | None]]:
+        """
+        Funzione usata per la multiprogrammazione: applica crossover e mutazione (installati nel processo)
+        a ogni gruppo di genitori selezionati e restituisce tutti i figli generati, con il loro hash strutturale.
+        I figli il cui hash e' in `skip` (vedi `_keyPrefix`) hanno un fitness gia' noto al processo principale e non vengono valutati.
+        Ogni task e' della forma (genitori, posizioni per i figli): ogni genitore e' accompagnato dalla posizione delle sue predizioni
+        nell'archivio delle predizioni (se note). In tal caso il fitness del figlio i-esimo viene calcolato
+        ri-classificando solo le istanze che raggiungono i sotto alberi in cui differisce dal genitore i-esimo.
+        Le predizioni del figlio i-esimo vengono scritte nella i-esima posizione per i figli (se presente).
+        Per ogni figlio restituisce (figlio, hash strutturale, fitness, posizione delle predizioni), con fitness e posizione None
+        se il figlio non e' stato valutato o se il fitness non e' un PredictionBasedFitness
+        """
+        fitness = _workerOperators["fitness"]
+        store: PredictionStore | None = _workerOperators["predictions"]
+        newElements = list()
+        for parents, slots in tasks:
+            children = _workerOperators["crossover"]([p for p, _ in parents])
+            for i, e in enumerate(children):
+                _workerOperators["mutation"](e)
+                key = e.structuralHash()
+                if not isinstance(fitness, PredictionBasedFitness) or _keyPrefix(key) in skip:
+                    newElements.append((e, key, None, None))
+                    continue
+                parent, parentSlot = parents[i % len(parents)]
+                predictions = fitness.predictions(e, None if parentSlot is None else (parent, store.read(parentSlot)))
+                slot = slots[i] if i < len(slots) else None
+                if slot is not None:
+                    store.write(slot, predictions)
+                newElements.append((e, key, fitness.score(predictions), slot))
         return newElements
 
+    @staticmethod
+    def _steadyWorker(parents: list[tuple[DecisionTree, int | None]], slots: list[int | None], skip: frozenset[int]) -> list[tuple[DecisionTree, str, float | None, int | None]]:
+        """
+        Funzione usata per la multiprogrammazione in modalita' steady-state: come `_worker` per una sola coppia di genitori,
+        ma il fitness dei figli non presenti in `skip` viene sempre calcolato nel processo
+        """
+        fitness = _workerOperators["fitness"]
+        return [(e, key, fitness(e) if f is None and _keyPrefix(key) not in skip else f, slot)
+                for e, key, f, slot in GA._worker([(parents, slots)], skip)]
+
+    @staticmethod
+    def _allocate(store: PredictionStore | None, count: int) -> list[int | None]:
+        """
+        Assegna `count` posizioni dell'archivio delle predizioni per i figli di un task (None se l'archivio e' pieno o assente)
+        """
+        return [None if store is None else store.allocate() for _ in range(count)]
+
+    def _skipKeys(self, known: dict[str, float]) -> set[int]:
+        """
+        Hash (vedi `_keyPrefix`) degli alberi con fitness noto, in `known` o nella cache: i figli con questi hash non vengono valutati
+        """
+        return {_keyPrefix(key) for key in known} | {_keyPrefix(key) for key in self.fitnessCache.keys()}
+
+    def _evaluatePopulation(self, pool: multiprocessing.Pool, store: PredictionStore | None, keys: list[str], known: dict[str, float], slotOf: dict[str, int]) -> list[float]:
+        """
+        Calcolo del fitness degli alberi della popolazione con la multiprogrammazione. Vengono valutati solo gli alberi che non sono
+        gia' in `known` o nella cache, una sola volta per ogni struttura distinta presente nella popolazione.
+        Il fitness degli alberi valutati viene aggiunto a `known` e la posizione delle loro predizioni a `slotOf`
+
+        Parameters
+        ----------
+        pool: multiprocessing.Pool
+            Pool su cui valutare gli alberi
+        store: PredictionStore | None
+            archivio delle predizioni (None se il fitness non e' un PredictionBasedFitness)
+        keys: list[str]
+            hash strutturale di ogni albero della popolazione
+        known: dict[str, float]
+            fitness gia' noti (key = hash strutturale)
+        slotOf: dict[str, int]
+            posizione nell'archivio delle predizioni gia' note (key = hash strutturale)
+
+        Return
+        ------
+        list[float]: fitness di ogni albero della popolazione
+        """
+        pending: dict[str, tuple[ApplyResult, int | None]] = dict()
+        for key, elem in zip(keys, self.population):
+            if key in known or key in pending:
+                continue
+            fitness = self.fitnessCache.get(key)
+            if fitness is None:
+                slot = GA._allocate(store, 1)[0]
+                pending[key] = (pool.apply_async(GA._evaluate, [elem, slot]), slot)
+            else:
+                known[key] = fitness
+        for key, (result, slot) in pending.items():
+            known[key] = result.get()
+            if slot is not None:
+                slotOf[key] = slot
+            self.fitnessCache.put(key, known[key])
+        return [known[key] for key in keys]
+
+    def _selectParents(self, keys: list[str], fitnessPopulation: list[float], slotOf: dict[str, int], draws: int) -> list[list[tuple[DecisionTree, int | None]]]:
+        """
+        Seleziona i genitori di draws iterazioni del crossover, ognuno accompagnato dalla posizione delle sue predizioni (se note).
+        Una IndexSelection estrae gli indici dei genitori di tutte le draws in una sola chiamata
+        """
+        if isinstance(self.selection, IndexSelection):
+            return [[(self.population[i], slotOf.get(keys[i])) for i in parents]
+                    for parents in self.selection.select(fitnessPopulation, draws)]
+        keyOf = {id(elem): key for key, elem in zip(keys, self.population)}
+        return [[(p, slotOf.get(keyOf.get(id(p)))) for p in self.selection(self.population, fitnessPopulation)] for _ in range(draws)]
+
     def run(self, processes: int | None = None):
         """
         Esecuzione dell'algoritmo genetico con le configurazioni date
         """
+        # se e' la prima generazione, usa la funzione genPopulation e salva su file gli alberi generati
+        if len(self.population) == 0:
+            self.population = self.genPopulation()
+            self.populationGeneration = 0
+            for i, tree in enumerate(self.population):
+                tree.save(os.path.join(self.datastorePath, GA.FIRST_GEN_LOCATION, str(i)), persistent=False)
+        # il checkpoint puo' essere piu' vecchio della history (vedi Pack.checkpointInterval): le generazioni successive vengono
+        # eliminate dalla history e ricalcolate, cosi' il contatore delle generazioni e la history restano allineati.
+        # Ripartendo dalla prima generazione (firstgen), la history viene svuotata
+        if self.populationGeneration is not None:
+            removed = self.history.truncate(self.populationGeneration)
+            if removed > 0:
+                print(f"[GA.run] history truncated to generation {self.populationGeneration}: {removed} generations after the checkpoint will be recomputed")
+            self.populationGeneration = None  # da qui in poi popolazione e history procedono insieme
+
         # Try to resume a previously computed generation
-        history = self.getHistory()
+        history = self.history.scalars()
         bestFitness = avgFitness = generation = 0
         if len(history) > 0:
-            generation = history[-1][0]
-            bestFitness = history[-1][1]
-            avgFitness = history[-1][3]
+            generation = int(history[-1]["generation"])
+            bestFitness = float(history[-1]["bestFitness"])
+            avgFitness = float(history[-1]["avgFitness"])
             print(f"[GA.run] Resuming GA execution: generation:{generation}  best_fitness:{bestFitness}  avgFitness:{avgFitness}")
         else:
             print(f"[GA.run] Starting GA execution")
 
-        fitnessPopulation: list[float] = list()
-        results: list[ApplyResult] = list()  # usato per la multiprogrammazione
-        # se e' la prima generazione, usa la funzione genPopulation e salva su file gli alberi generati
-        if len(self.population) == 0:
-            self.population = self.genPopulation()
-            for i, tree in enumerate(self.population):
-                tree.save(os.path.join(self.datastorePath, GA.FIRST_GEN_LOCATION, str(i)), persistent=False)
-        with open(os.path.join(self.datastorePath, GA.HISTORY_FILE_NAME), 'a') as archive, multiprocessing.Pool(processes=processes) as pool:
+        # i dataset usati dagli operatori vengono messi in memoria condivisa: i processi del Pool vi si collegano all'avvio
+        # e i task non contengono piu' una copia dei dati
+        datasets = findDatasets(self.fitness, self.selection, self.crossover, self.mutation)
+        segments = [d.share() for d in datasets]
+        # le predizioni degli alberi vengono scritte e lette dai processi del Pool in un archivio in memoria condivisa:
+        # servono posizioni per la popolazione e per i figli in corso di valutazione (oltre ai genitori ancora in uso, in steady-state)
+        store = None
+        if isinstance(self.fitness, PredictionBasedFitness):
+            inFlight = 8 * (processes or os.cpu_count()) if self.steadyState else 4 * self.draws + self.elitismSize
+            store = PredictionStore(self.fitness.datasets, len(self.population) + inFlight)
+            store.share()
+        try:
+            if self.steadyState:
+                self._runSteadyState(generation, bestFitness, avgFitness, processes, segments, store)
+            else:
+                self._run(generation, bestFitness, avgFitness, processes, segments, store)
+        finally:
+            for d in datasets:
+                d.release()
+            if store is not None:
+                store.release()
+        print(f"[GA.run] Terminated  fitness_cache_hits:{self.fitnessCache.hits}  fitness_cache_misses:{self.fitnessCache.misses}")
+
+    def _run(self, generation: int, bestFitness: float, avgFitness: float, processes: int | None, segments: list[str], store: PredictionStore | None):
+        """
+        Ciclo delle generazioni del GA (vedi `run`)
+        """
+        results: list[tuple[ApplyResult, list[int | None]]] = list()  # usato per la multiprogrammazione: task e posizioni assegnate ai figli
+        # fitness degli individui della prossima generazione gia' valutati durante la riproduzione (key = hash strutturale)
+        known: dict[str, float] = dict()
+        # posizione nell'archivio delle predizioni degli individui della generazione corrente e della prossima (key = hash strutturale)
+        slotOf: dict[str, int] = dict()
+        chunks = self.chunks if self.chunks is not None else (processes or os.cpu_count())
+        chunkSize = max(1, -(-self.draws // chunks))  # numero di iterazioni del crossover eseguite da ogni task
+        keys: list[str] | None = None  # hash strutturale degli individui della popolazione (calcolati dai processi per i figli)
+        # il checkpoint viene scritto da un thread separato: la generazione successiva parte senza attendere il disco
+        checkpoint: Future | None = None
+        with multiprocessing.Pool(processes=processes, initializer=GA._initWorker, initargs=(self.fitness, self.crossover, self.mutation, segments, store)) as pool, \
+                ThreadPoolExecutor(max_workers=1) as writer:
             while (self.stopCondition is None
                    or not self.stopCondition(generation, bestFitness, avgFitness)):
 
                 generation += 1
-                fitnessPopulation.clear()
-                results.clear()
-                for elem in self.population:
-                    results.append(pool.apply_async(self.fitness, [elem]))  # Calcolo del fitness degli alberi con la multiprogrammazione
-                for result in results:
-                    fitnessPopulation.append(result.get())
+                if keys is None:
+                    keys = [elem.structuralHash() for elem in self.population]
+                fitnessPopulation = self._evaluatePopulation(pool, store, keys, known, slotOf)
+                # i figli strutturalmente identici a un albero gia' valutato non vengono valutati dai processi
+                skip = frozenset(self._skipKeys(known))
 
                 newPopulation = list()
+                newKeys = list()
                 results.clear()
                 # draws e' il numero di iterazioni del crossover per ogni generazione
-                # per ogni draws, lancia quindi la funzione _worker in parallelo ottenendo gli individui della nuova generazione
-                for _ in range(self.draws):
-                    results.append(pool.apply_async(GA._worker, [self.selection, self.crossover, self.mutation, self.population, fitnessPopulation]))
-                for r in results:
-                    newPopulation.extend(r.get())
+                # per ogni draws seleziona i genitori, poi suddivide le coppie selezionate in gruppi di chunkSize e lancia la funzione _worker
+                # in parallelo su ogni gruppo ottenendo gli individui della nuova generazione.
+                # La selezione avviene in questo processo: ai task vengono inviati solo i genitori (con la posizione delle loro predizioni)
+                # e non tutta la popolazione
+                selected = self._selectParents(keys, fitnessPopulation, slotOf, self.draws)
+                for k in range(0, self.draws, chunkSize):
+                    tasks = [(parents, GA._allocate(store, len(parents))) for parents in selected[k:k + chunkSize]]
+                    results.append((pool.apply_async(GA._worker, [tasks, skip]), [slot for _, slots in tasks for slot in slots]))
+                nextKnown: dict[str, float] = dict()
+                for r, allocated in results:
+                    kept = set()
+                    for child, key, fitness, slot in r.get():
+                        newPopulation.append(child)
+                        newKeys.append(key)
+                        if fitness is None:
+                            if _keyPrefix(key) in skip:
+                                # figlio non valutato: il fitness e' nella cache (o nella generazione corrente, con le sue predizioni)
+                                fitness = self.fitnessCache.get(key)
+                                if fitness is None:
+                                    fitness = known.get(key)
+                                if fitness is not None:
+                                    nextKnown[key] = fitness
+                            # altrimenti viene valutato all'inizio della prossima generazione
+                            continue
+                        nextKnown[key] = fitness
+                        self.fitnessCache.put(key, fitness)
+                        if slot is not None and key not in slotOf:
+                            slotOf[key] = slot
+                            kept.add(slot)
+                    # le posizioni non usate (o di figli gia' presenti) tornano libere
+                    for slot in allocated:
+                        if slot is not None and slot not in kept:
+                            store.free(slot)
 
                 # se e' stato impostato l'elistmSize, aggiunge gli individui migliore della generazione corrente nella prossima generazione
                 if self.elitismSize > 0:
                     if len(fitnessPopulation) < self.elitismSize:
-                        newPopulation.extend(self.population)
+                        elitism = range(len(self.population))
                     else:
                         elitism = np.argpartition(fitnessPopulation, -self.elitismSize)[-self.elitismSize:]  # ottiene gli indici degli individui con miglior fitness
-                        for index in elitism:
-                            newPopulation.append(self.population[index])
+                    for index in elitism:
+                        newPopulation.append(self.population[index])
+                        newKeys.append(keys[index])
+                        # l'individuo passa nella prossima generazione con il suo fitness (e le sue predizioni, che restano in slotOf)
+                        nextKnown[keys[index]] = known[keys[index]]
+                known = nextKnown
+                # le predizioni degli individui che non passano alla prossima generazione non servono piu'
+                for key in [key for key in slotOf if key not in known]:
+                    store.free(slotOf.pop(key))
 
                 # HISTORY management
                 # Salva nella history i dati relativi alla generazione corrente
                 bestFitnessIndex = np.argmax(fitnessPopulation)  # ottiene l'indice dell'individuo con miglior fitness
                 bestFitness = fitnessPopulation[bestFitnessIndex]
                 avgFitness = sum(fitnessPopulation) / len(fitnessPopulation)  # calcola la media del fitness della popolazione
-                GA.saveHistoryRow(archive, (generation, bestFitness, self.population[bestFitnessIndex], avgFitness))
+                self.history.append(generation, bestFitness, self.population[bestFitnessIndex], avgFitness)
                 print(f"[GA.run] generation:{generation}  best_fitness:{bestFitness}  avgFitness:{avgFitness}")
-                # Salva su file la nuova popolazione sovrascrivendo la precedente
-                for n, i in enumerate(newPopulation):
-                    i.save(f"{self.datastorePath}/{GA.LAST_GEN_LOCATION}/{n}", persistent=False)
-
                 self.population = newPopulation
-        print(f"[GA.run] Terminated")
+                keys = newKeys
+                # Salva su file la nuova popolazione sovrascrivendo la precedente (il salvataggio precedente deve essere terminato)
+                if generation % self.checkpointInterval == 0:
+                    if checkpoint is not None:
+                        checkpoint.result()
+                    checkpoint = writer.submit(self._saveCheckpoint, generation, newPopulation)
+            if checkpoint is not None:
+                checkpoint.result()
+            if generation % self.checkpointInterval != 0:
+                self._saveCheckpoint(generation, self.population)
+
+    def _runSteadyState(self, generation: int, bestFitness: float, avgFitness: float, processes: int | None, segments: list[str], store: PredictionStore | None):
+        """
+        Ciclo del GA in modalita' steady-state (vedi `Pack`): il Pool ha sempre 2 task per processo in esecuzione, ognuno riproduce
+        e valuta una coppia di genitori. Appena un task termina, i suoi figli sostituiscono gli individui peggiori della popolazione
+        e viene lanciato un nuovo task con genitori selezionati dalla popolazione aggiornata
+        """
+        processes = processes or os.cpu_count()
+        # i task terminati (o le eccezioni sollevate) vengono inseriti dal thread dei risultati del Pool nell'ordine in cui terminano
+        done: queue.Queue = queue.Queue()
+        checkpoint: Future | None = None
+        with multiprocessing.Pool(processes=processes, initializer=GA._initWorker, initargs=(self.fitness, self.crossover, self.mutation, segments, store)) as pool, \
+                ThreadPoolExecutor(max_workers=1) as writer:
+            # fitness e posizione delle predizioni degli individui presenti nella popolazione (key = hash strutturale)
+            known: dict[str, float] = dict()
+            slotOf: dict[str, int] = dict()
+            keys = [elem.structuralHash() for elem in self.population]
+            fitnessPopulation = self._evaluatePopulation(pool, store, keys, known, slotOf)
+            # hash degli alberi con fitness noto: i figli con questi hash non vengono valutati (ricostruito a ogni generazione)
+            skip = self._skipKeys(known)
+
+            def submit():
+                parents = self._selectParents(keys, fitnessPopulation, slotOf, 1)[0]
+                # le predizioni dei genitori non possono essere sovrascritte finche' il task non e' terminato,
+                # anche se nel frattempo i genitori escono dalla popolazione
+                pinned = [slot for _, slot in parents if slot is not None]
+                for slot in pinned:
+                    store.retain(slot)
+                slots = GA._allocate(store, len(parents))
+                pool.apply_async(GA._steadyWorker, [parents, slots, frozenset(skip)], callback=lambda r: done.put((r, pinned, slots)), error_callback=done.put)
+
+            for _ in range(2 * processes):
+                submit()
+            children = 0  # figli generati dall'ultima generazione
+            evaluations = 0  # figli valutati dai processi dall'ultima generazione (esclusi quelli gia' presenti nella cache)
+            start = time.perf_counter()
+            running = self.stopCondition is None or not self.stopCondition(generation, bestFitness, avgFitness)
+            while running:
+                item = done.get()
+                if isinstance(item, BaseException):
+                    raise item
+                result, pinned, allocated = item
+                kept = set()
+                for child, key, fitness, slot in result:
+                    children += 1
+                    if fitness is None:
+                        # figlio non valutato perche' gia' noto: se non e' piu' nella cache (ed e' quindi gia' nella popolazione) viene scartato
+                        fitness = self.fitnessCache.get(key)
+                        if fitness is None:
+                            continue
+                    else:
+                        evaluations += 1
+                        self.fitnessCache.put(key, fitness)
+                        skip.add(_keyPrefix(key))
+                    worst = int(np.argmin(fitnessPopulation))
+                    # il figlio entra nella popolazione solo se non e' gia' presente e migliora l'individuo peggiore
+                    if key in known or fitness <= fitnessPopulation[worst]:
+                        continue
+                    replaced = keys[worst]
+                    self.population[worst] = child
+                    keys[worst] = key
+                    fitnessPopulation[worst] = fitness
+                    known[key] = fitness
+                    if slot is not None:
+                        slotOf[key] = slot
+                        kept.add(slot)
+                    if replaced not in keys:
+                        known.pop(replaced, None)
+                        if replaced in slotOf:
+                            store.free(slotOf.pop(replaced))
+                # le posizioni dei figli scartati tornano libere, cosi' come quelle dei genitori non piu' in uso
+                for slot in allocated:
+                    if slot is not None and slot not in kept:
+                        store.free(slot)
+                for slot in pinned:
+                    store.free(slot)
+                submit()
+
+                # ogni len(popolazione) figli generati viene conclusa una generazione: history, condizione di stop e checkpoint
+                if children < len(self.population):
+                    continue
+                generation += 1
+                elapsed = time.perf_counter() - start
+                bestFitnessIndex = int(np.argmax(fitnessPopulation))
+                bestFitness = fitnessPopulation[bestFitnessIndex]
+                avgFitness = sum(fitnessPopulation) / len(fitnessPopulation)
+                self.history.append(generation, bestFitness, self.population[bestFitnessIndex], avgFitness)
+                print(f"[GA.run] generation:{generation}  best_fitness:{bestFitness}  avgFitness:{avgFitness}  evaluations/s:{evaluations / elapsed:.1f}")
+                children = 0
+                evaluations = 0
+                start = time.perf_counter()
+                skip = self._skipKeys(known)
+                if generation % self.checkpointInterval == 0:
+                    if checkpoint is not None:
+                        checkpoint.result()
+                    checkpoint = writer.submit(self._saveCheckpoint, generation, list(self.population))
+                running = self.stopCondition is None or not self.stopCondition(generation, bestFitness, avgFitness)
+            if checkpoint is not None:
+                checkpoint.result()
+            if generation % self.checkpointInterval != 0:
+                self._saveCheckpoint(generation, self.population)
@@ -0,0 +1,192 @@
+"""
+Archivio della history del GA: per ogni generazione vengono salvati numero di generazione, fitness migliore, fitness medio
+e albero migliore. L'archivio e' composto da due file, entrambi scritti solo in coda:
+- un indice con un record di dimensione fissa per generazione (scalari e posizione dell'albero nel file degli alberi),
+  cosi' gli scalari si leggono senza deserializzare gli alberi e l'albero di una generazione si legge con un solo accesso
+- il file degli alberi, con le righe complete (albero compreso) serializzate una dopo l'altra con pickle: il file e' autosufficiente
+  e, se l'indice viene perso, l'indice viene ricostruito leggendolo
+"""
+from __future__ import annotations
+import os
+import pickle
+
+import numpy as np
+
+from training.decisionTree3 import DecisionTree
+
+
+INDEX_FILE_NAME = "history.idx"
+TREES_FILE_NAME = "history.bin"
+LEGACY_FILE_NAME = "history.ga"  # vecchio formato: una riga per generazione con la tupla serializzata in esadecimale
+
+# record dell'indice: scalari della generazione e posizione (offset, lunghezza in byte) dell'albero migliore nel file degli alberi
+RECORD = np.dtype([("generation", "<i8"), ("bestFitness", "<f8"), ("avgFitness", "<f8"), ("offset", "<i8"), ("length", "<i8")])
+
+
+class HistoryStore:
+    """
+    History del GA salvata su file. Ogni riga e' della forma (numGenerazione, bestFitness, DecisionTreeBestFitness, avgFitness)
+
+    Methods
+    -------
+    append(generation: int, bestFitness: float, tree: DecisionTree, avgFitness: float) -> None
+        aggiunge una generazione in coda alla history
+    scalars() -> numpy.ndarray
+        restituisce generazione e fitness di tutte le generazioni, senza leggere gli alberi
+    tree(k: int) -> DecisionTree
+        restituisce l'albero migliore della k-esima riga
+    rows() -> list[tuple[int, float, DecisionTree, float]]
+        restituisce tutta la history
+    truncate(generation: int) -> int
+        elimina le generazioni successive a `generation`
+    """
+
+    def __init__(self, directory: str):
+        """
+        Parameters
+        ----------
+        directory: str
+            cartella in cui si trovano i file della history. Se manca l'indice ma non il file degli alberi, l'indice viene
+            ricostruito dal file degli alberi. Se contiene solo una history nel vecchio formato, la history viene convertita nel nuovo formato
+        """
+        self.indexPath = os.path.join(directory, INDEX_FILE_NAME)
+        self.treesPath = os.path.join(directory, TREES_FILE_NAME)
+        legacyPath = os.path.join(directory, LEGACY_FILE_NAME)
+        if not os.path.isfile(self.indexPath):
+            if os.path.isfile(self.treesPath) and os.path.getsize(self.treesPath) > 0:
+                records = self._scanTrees()
+                print(f"[HistoryStore] {INDEX_FILE_NAME} not found: rebuilt from {TREES_FILE_NAME} ({len(records)} generations)")
+            else:
+                records = list()
+                with open(self.treesPath, "wb") as trees:
+                    if os.path.isfile(legacyPath):
+                        with open(legacyPath, "r") as file:
+                            for line in file:
+                                generation, bestFitness, tree, avgFitness = pickle.loads(bytes.fromhex(line))
+                                data = pickle.dumps((generation, bestFitness, tree, avgFitness), protocol=pickle.HIGHEST_PROTOCOL)
+                                records.append((generation, bestFitness, avgFitness, trees.tell(), len(data)))
+                                trees.write(data)
+            # l'indice viene creato solo a conversione completata: se si interrompe, verra' ripetuta alla prossima apertura
+            np.array(records, dtype=RECORD).tofile(f"{self.indexPath}.tmp")
+            os.replace(f"{self.indexPath}.tmp", self.indexPath)
+        else:
+            # un record scritto solo in parte (per esempio per un'interruzione durante il salvataggio) viene scartato
+            size = os.path.getsize(self.indexPath)
+            if size % RECORD.itemsize != 0:
+                with open(self.indexPath, "r+b") as file:
+                    file.truncate(size - size % RECORD.itemsize)
+
+    def _scanTrees(self) -> list[tuple[int, float, float, int, int]]:
+        """
+        Legge in sequenza le righe del file degli alberi e ne ricava i record dell'indice.
+        Una riga scritta solo in parte in coda al file (per esempio per un'interruzione durante il salvataggio) viene eliminata
+
+        Return
+        ------
+        list[tuple[int, float, float, int, int]]: i record dell'indice (vedi RECORD), uno per riga
+        """
+        records = list()
+        with open(self.treesPath, "r+b") as file:
+            end = 0  # fine dell'ultima riga completa
+            while True:
+                try:
+                    row = pickle.load(file)
+                except (EOFError, pickle.UnpicklingError):
+                    break
+                if not (isinstance(row, tuple) and len(row) == 4):
+                    raise ValueError(f"{self.treesPath} does not contain history rows: the index cannot be rebuilt")
+                generation, bestFitness, _, avgFitness = row
+                records.append((generation, bestFitness, avgFitness, end, file.tell() - end))
+                end = file.tell()
+            file.truncate(end)
+        return records
+
+    def __len__(self):
+        return os.path.getsize(self.indexPath) // RECORD.itemsize
+
+    def append(self, generation: int, bestFitness: float, tree: DecisionTree, avgFitness: float) -> None:
+        """
+        Aggiunge una generazione in coda alla history. L'albero viene scritto prima del record dell'indice:
+        se il salvataggio si interrompe, l'indice non punta mai a un albero incompleto
+
+        Parameters
+        ----------
+        generation: int
+            numero della generazione
+        bestFitness: float
+            fitness migliore della generazione
+        tree: DecisionTree
+            albero con il fitness migliore
+        avgFitness: float
+            fitness medio della generazione
+        """
+        data = pickle.dumps((generation, bestFitness, tree, avgFitness), protocol=pickle.HIGHEST_PROTOCOL)
+        with open(self.treesPath, "ab") as file:
+            offset = file.tell()
+            file.write(data)
+        record = np.array([(generation, bestFitness, avgFitness, offset, len(data))], dtype=RECORD)
+        with open(self.indexPath, "ab") as file:
+            file.write(record.tobytes())
+
+    def scalars(self) -> np.ndarray:
+        """
+        Restituisce gli scalari di tutte le generazioni, senza leggere gli alberi
+
+        Return
+        ------
+        numpy.ndarray: array strutturato con i campi "generation", "bestFitness" e "avgFitness" (e la posizione degli alberi), una riga per generazione
+        """
+        return np.fromfile(self.indexPath, dtype=RECORD, count=len(self))
+
+    def tree(self, k: int) -> DecisionTree:
+        """
+        Restituisce l'albero migliore della k-esima riga della history (k negativo conta dalla fine)
+        """
+        return self[k][2]
+
+    def __getitem__(self, k: int) -> tuple[int, float, DecisionTree, float]:
+        n = len(self)
+        if not -n <= k < n:
+            raise IndexError("history index out of range")
+        k %= n
+        with open(self.indexPath, "rb") as file:
+            file.seek(k * RECORD.itemsize)
+            record = np.frombuffer(file.read(RECORD.itemsize), dtype=RECORD)[0]
+        with open(self.treesPath, "rb") as file:
+            file.seek(int(record["offset"]))
+            tree = pickle.loads(file.read(int(record["length"])))[2]
+        return int(record["generation"]), float(record["bestFitness"]), tree, float(record["avgFitness"])
+
+    def rows(self) -> list[tuple[int, float, DecisionTree, float]]:
+        """
+        Restituisce tutta la history, leggendo il file degli alberi una sola volta
+        """
+        records = self.scalars()
+        with open(self.treesPath, "rb") as file:
+            data = file.read()
+        return [(int(r["generation"]), float(r["bestFitness"]), pickle.loads(data[r["offset"]:r["offset"] + r["length"]])[2], float(r["avgFitness"]))
+                for r in records]
+
+    def truncate(self, generation: int) -> int:
+        """
+        Elimina dalla history le generazioni successive a `generation`. Viene accorciato prima l'indice e poi il file degli alberi:
+        un'interruzione tra i due lascia solo righe in piu' in coda al file degli alberi, a cui l'indice non fa riferimento
+
+        Parameters
+        ----------
+        generation: int
+            ultima generazione da mantenere
+
+        Return
+        ------
+        int: numero di generazioni eliminate
+        """
+        records = self.scalars()
+        keep = int(np.count_nonzero(records["generation"] <= generation))
+        if keep == len(records):
+            return 0
+        with open(self.indexPath, "r+b") as file:
+            file.truncate(keep * RECORD.itemsize)
+        with open(self.treesPath, "r+b") as file:
+            file.truncate(int(records[keep]["offset"]))
+        return len(records) - keep
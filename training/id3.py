@@ -1,123 +1,170 @@
 from __future__ import annotations
 import numpy as np
 import pandas as pd
+from training.dataset import EncodedDataset
 from training.decisionTree3 import DecisionTree, DecisionNode, FeatureSet
-from math import inf
 
 
-def id3(trainingSet: pd.DataFrame, features: FeatureSet) -> DecisionTree:
+def id3(trainingSet: pd.DataFrame | EncodedDataset, features: FeatureSet, rows: np.ndarray = None) -> DecisionTree:
     """
-    Genera un albero decisionale. Viene usata l'entropia come misura per la scelta delle features
+    Genera un albero decisionale. Viene usata l'entropia come misura per la scelta delle features.
+    Durante l'induzione il dataset non viene mai copiato: ogni nodo conosce solo gli indici delle righe che deve classificare
 
     Parameters
     ----------
-    trainingSet: pandas.DataFrame
+    trainingSet: pandas.DataFrame | EncodedDataset
         dataset da cui generare l'albero
     features: FeatureSet
         features dell'albero
+    rows: numpy.ndarray = None
+        indici delle righe del trainingSet da usare. Se None, vengono usate tutte le righe
 
     Return
     ------
     DecisionTree: albero generato
     """
+    dataset = EncodedDataset.of(trainingSet, features)
     t = DecisionTree(features)
     t.add(DecisionNode())  # Aggiunge il nodo radice all' albero. Il nodo attualmente e' vuoto
-    stack = [(0, trainingSet)]  # Lo stack contiene tuple del tipo (idNode, trainingSet) dove trainingSet contiene solo gli esempi che il nodo deve classificare
+    # Lo stack contiene tuple del tipo (idNode, rows) dove rows contiene gli indici dei soli esempi che il nodo deve classificare
+    stack = [(0, np.arange(len(dataset)) if rows is None else np.asarray(rows))]
 
     while len(stack) > 0:
-        nodeId, dataset = stack.pop()
+        nodeId, rows = stack.pop()
         node = t.nodes.get(nodeId)
-        outputDomain = dataset.index  # Ottiene tutte le classificazioni delle istanze in dataset
 
-        if dataset.empty:
+        if rows.size == 0:
             continue
 
+        outputCounts = dataset.classCounts(rows)  # numero di ricorrenze di ogni classificazione delle istanze del nodo
+
         # se c'e' una sola classificazione, la assegna al nodo
-        if outputDomain.unique().size == 1:
-            node.out = outputDomain[0]
+        if np.count_nonzero(outputCounts) == 1:
+            node.out = dataset.classes[dataset.labels[rows[0]]]
             continue
 
         # altrimenti ricava la feature e il threshold migliore secondo l'entropia
-        bestFeature, bestValue = bestFeatureByEntropy(dataset, features)
+        bestFeature, bestValue = bestFeatureByEntropy(dataset, features, rows)
         node.feature = bestFeature
 
         # usiamo la classificazione piu' ricorrente nel dataset come valore di default per i nodi figli
-        default = outputDomain.value_counts().idxmax()
+        default = dataset.classes[np.argmax(outputCounts)]
 
         if bestFeature is None:
             """In caso non si possono piu' effettuare tagli al dataset (il dataset contiene 'rumore' che porta istanze uguali ad avere output diversi)"""
             node.out = default
             continue
 
-        # se la feature selezionata ha un ordinamento, generiamo due nodi figli e dividiamo il dataset secondo i valori minori/maggiori del threshold
+        # se la feature selezionata ha un ordinamento, generiamo due nodi figli e dividiamo le righe secondo i valori minori/maggiori del threshold
         if features[node.feature].isNumerical():
             node.threshold = bestValue
-            cD = dataset[dataset[node.feature] < node.threshold]  # cD conterra' solo le istanze con feature < threshold
+            left = dataset.lessThan(node.feature, node.threshold, rows)
             cId = t.add(DecisionNode(out=default), nodeId, True)  # aggiungiamo il nodo all'albero
-            stack.append((cId, cD))
+            stack.append((cId, rows[left]))  # solo le istanze con feature < threshold
 
-            cD = dataset[dataset[node.feature] >= node.threshold]  # cD conterra' solo le istanze con feature >= threshold
             cId = t.add(DecisionNode(out=default), nodeId, False)  # aggiungiamo il nodo all'albero
-            stack.append((cId, cD))
-        # se invece la feature non ha un ordinamento, generiamo un figlio per ogni valore del dominio (osservato) della feature e ripartiamo di conseguenza il dataset
+            stack.append((cId, rows[~left]))  # solo le istanze con feature >= threshold
+        # se invece la feature non ha un ordinamento, generiamo un figlio per ogni valore del dominio (osservato) della feature e ripartiamo di conseguenza le righe
         else:
-            for label in dataset[node.feature].unique():  # per ogni valore del dominio (osservato) della feature
-                cD = dataset[dataset[node.feature] == label]  # cD conterra' solo le istanze con feature = label
-                cId = t.add(DecisionNode(out=default), nodeId, label)  # aggiungiamo il nodo all'albero
-                stack.append((cId, cD))
+            codes = dataset.values[node.feature][rows]
+            for code in np.unique(codes):  # per ogni valore del dominio (osservato) della feature
+                cId = t.add(DecisionNode(out=default), nodeId, dataset.vocabulary[node.feature][code])  # aggiungiamo il nodo all'albero
+                stack.append((cId, rows[codes == code]))  # solo le istanze con feature = label
     return t
 
 
-def bestFeatureByEntropy(dataset: pd.DataFrame, features: FeatureSet) -> tuple[str, int]:
+def _entropy(counts: np.ndarray) -> np.ndarray:
+    """
+    Calcola l'entropia a partire dal numero di ricorrenze di ogni classificazione.
+    `counts` puo' essere una matrice: in questo caso viene calcolata l'entropia di ogni riga
+    """
+    N = counts.sum(axis=-1, keepdims=True)
+    p = counts / np.maximum(N, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(p > 0, p * np.log2(p), 0)
+    return -terms.sum(axis=-1)
+
+
+def _bestThreshold(values: np.ndarray, labels: np.ndarray, nClasses: int, H: float) -> tuple[float, any]:
+    """
+    Calcola il guadagno di entropia di ogni valore osservato di una feature numerica usato come threshold e restituisce il migliore.
+    Invece di partizionare il dataset per ogni threshold, la colonna viene ordinata una sola volta: il numero di ricorrenze
+    di ogni classificazione con valore < threshold e' la somma cumulativa delle classificazioni fino alla prima occorrenza del threshold
+
+    Parameters
+    ----------
+    values: numpy.ndarray
+        valori della feature
+    labels: numpy.ndarray
+        codici delle classificazioni
+    nClasses: int
+        numero di classificazioni distinte
+    H: float
+        entropia del dataset
+
+    Return
+    ------
+    tuple[float, any]: la coppia (guadagno di entropia, threshold)
+    """
+    N = values.size
+    order = np.argsort(values, kind="stable")
+    sortedValues = values[order]
+    # cumulative[k] contiene il numero di ricorrenze di ogni classificazione tra le prime k istanze ordinate
+    cumulative = np.zeros((N + 1, nClasses), dtype=np.int64)
+    np.cumsum(np.eye(nClasses, dtype=np.int64)[labels[order]], axis=0, out=cumulative[1:])
+
+    # posizione della prima occorrenza di ogni valore osservato: le istanze precedenti sono quelle con valore < threshold
+    starts = np.flatnonzero(np.concatenate(([True], sortedValues[1:] != sortedValues[:-1])))
+    oiLeft = cumulative[starts]              # numero di ricorrenze di ogni classificazione con attr < threshold
+    oiRight = cumulative[N] - oiLeft         # numero di ricorrenze di ogni classificazione con attr >= threshold
+    Hi = (starts / N) * _entropy(oiLeft) + ((N - starts) / N) * _entropy(oiRight)
+    best = np.argmax(H - Hi)
+    return H - Hi[best], sortedValues[starts[best]].item()
+
+
+def bestFeatureByEntropy(dataset: EncodedDataset, features: FeatureSet, rows: np.ndarray = None) -> tuple[str, int]:
     """
     Seleziona la feature migliore e il suo valore di threshold secondo l'entropia
 
     Parameters
     ----------
-    dataset: pandas.DataFrame
+    dataset: EncodedDataset
         dataset per calcolare l'entropia
     features: FeatureSet
         features tra cui scegliere
+    rows: numpy.ndarray = None
+        indici delle righe del dataset da considerare. Se None, vengono considerate tutte le righe
 
     Return
     ------
     tuple[str, int]: restituisce la coppia (features, threshold)
     """
-    N = dataset.index.size  # Numero di esempi nel dataset
-    o = dataset.index.value_counts()  # restituisce il numero di ricorrenze di ogni classificazione del dataset
-    H = -np.sum([x / N * np.log2(x / N) for x in o])
+    if rows is None:
+        rows = np.arange(len(dataset))
+    N = rows.size  # Numero di esempi considerati
+    nClasses = len(dataset.classes)
+    labels = dataset.labels[rows]
+    H = _entropy(dataset.classCounts(rows))
 
     bestDeltaH = 0
     bestAttr = None
     bestValue = None
     for attr in dataset.columns:  # per ogni features del dataset
+        values = dataset.values[attr][rows]
         if features[attr].isNumerical():
-            # per ogni valore osservato della feature calcolo l'entropia usando il valore corrente 'i' come threshold
-            for i in dataset[attr].unique():
-                NiLeft = dataset[dataset[attr] < i].index.size  # numero di istanze con attr < i
-                oiLeft = dataset[dataset[attr] < i].index.value_counts()  # numero di ricorrenze di ogni classificazione con attr < i
-                HiLeft = -np.sum([x / NiLeft * np.log2(x / NiLeft) for x in oiLeft])
-
-                NiRight = dataset[dataset[attr] >= i].index.size # numero di istanze con attr >= i
-                oiRight = dataset[dataset[attr] >= i].index.value_counts()  # numero di ricorrenze di ogni classificazione con attr >= i
-                HiRight = -np.sum([x / NiRight * np.log2(x / NiRight) for x in oiRight])
-
-                Hi = (NiLeft / N) * HiLeft + (NiRight / N) * HiRight
-                deltaH = H - Hi
-                if deltaH > bestDeltaH:  # trovata feature e threshold migliori
-                    bestDeltaH = deltaH
-                    bestValue = i
-                    bestAttr = attr
+            deltaH, value = _bestThreshold(values, labels, nClasses, H)
+            if deltaH > bestDeltaH:  # trovata feature e threshold migliori
+                bestDeltaH = deltaH
+                bestValue = value
+                bestAttr = attr
 
         else:
-            Hattr = 0
-            for i in dataset[attr].unique():  # per ogni valore osservato della feature
-                Ni = dataset[dataset[attr] == i].index.size  # numero di istanze con attr = i
-                oi = dataset[dataset[attr] == i].index.value_counts() # numero di ricorrenze di ogni classificazione con attr = i
-                Hi = -np.sum([x / Ni * np.log2(x / Ni) for x in oi])
-                Hattr += (Ni / N) * Hi
+            # oi[v] contiene il numero di ricorrenze di ogni classificazione con attr = v
+            oi = np.bincount(values.astype(np.int64) * nClasses + labels, minlength=len(dataset.vocabulary[attr]) * nClasses).reshape(-1, nClasses)
+            Ni = oi.sum(axis=1)  # numero di istanze con attr = v
+            Hattr = np.sum((Ni / N) * _entropy(oi))
             deltaH = H - Hattr
             if deltaH > bestDeltaH:  # trovata feature e threshold migliori
                 bestDeltaH = deltaH
                 bestAttr = attr
-    return bestAttr, bestValue
\ No newline at end of file
+    return bestAttr, bestValue
@@ -4,6 +4,30 @@ from typing import Callable
 from game.gameInstance import Actions, GameInstance
 from training.decisionTree3 import FeatureSet
 
+_BUFFER_SIZE = 1 << 20  # dimensione (in byte) del buffer di scrittura del dataset
+
+
+def recordLine(features: FeatureSet, featuresExtractor: Callable[[GameInstance], dict[str, any]], gi: GameInstance, action: Actions) -> str:
+    """
+    Restituisce la riga del dataset (csv) con le informazioni osservate in gi e l'azione scelta nello stesso contesto
+
+    Parameters
+    ----------
+    features: FeatureSet
+        insieme di features
+    featuresExtractor: Callable[[GameInstance], dict[str, any]]
+        funzione per estrarre i valori delle features
+    gi: GameInstance
+        istanza di gioco
+    action: Actions
+        azione scelta nel contesto di gi
+
+    Return
+    ------
+    str: riga del dataset, terminata da un a capo
+    """
+    return f"{action.name},{features.toCsv(featuresExtractor(gi))}\n"
+
 
 class Logger:
     """
@@ -13,6 +37,10 @@ class Logger:
     -------
     record(gi: GameInstance, action:Actions)
         registra le informazioni osservate e l'azione scelta nello stesso contesto
+    add(record: str) -> bool
+        registra una riga del dataset gia' formattata
+    flush()
+        scrive su file le righe ancora nel buffer
     """
     def __init__(self, filename: str, features: FeatureSet, featuresExtractor: Callable[[GameInstance], dict[str, any]], overwrite: bool = False):
         """
@@ -29,15 +57,20 @@ class Logger:
         overwrite: bool = False
             Sovrascrive il file se presente, altrimenti "appende" le righe al file esistente
         """
-        self.records = set()
+        # delle righe gia' registrate viene mantenuto solo l'hash (intero a 64 bit): la probabilita' di una collisione,
+        # che farebbe scartare una riga nuova, e' trascurabile per dataset di qualche milione di righe
+        self.records: set[int] = set()
         self.featuresExtractor = featuresExtractor
-        self.toCsv = features.toCsv
+        self.features = features
         # apre il file del dataset appendendo il nuovo contenuto a quello esistente se overwrite = False, altrimenti riscrive tutto il file
         if os.path.isfile(filename) and not overwrite:
-            self.file = open(filename, 'r+')
-            self.records = set(self.file.readlines())
+            with open(filename, 'r') as file:
+                file.readline()  # header
+                for line in file:
+                    self.records.add(hash(line))
+            self.file = open(filename, 'a', buffering=_BUFFER_SIZE)
         else:
-            self.file = open(filename, 'w')
+            self.file = open(filename, 'w', buffering=_BUFFER_SIZE)
             self.file.write(f",{features}\n")
 
     def __len__(self):
@@ -54,10 +87,33 @@ class Logger:
         action: Actions
             azione scelta nel contesto di gi
         """
-        record = f"{action.name},{self.toCsv(self.featuresExtractor(gi))}\n"
-        if record not in self.records:
-            self.records.add(record)
-            self.file.write(record)
+        self.add(recordLine(self.features, self.featuresExtractor, gi, action))
+
+    def add(self, record: str) -> bool:
+        """
+        Registra una riga del dataset gia' formattata (vedi `recordLine`), se non e' gia' presente
+
+        Parameters
+        ----------
+        record: str
+            riga del dataset
+
+        Return
+        ------
+        bool: True se la riga e' stata aggiunta, False se era gia' presente
+        """
+        key = hash(record)
+        if key in self.records:
+            return False
+        self.records.add(key)
+        self.file.write(record)
+        return True
+
+    def flush(self) -> None:
+        """
+        Scrive su file le righe ancora nel buffer
+        """
+        self.file.flush()
 
     def __del__(self):
         self.file.close()